@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+负载生成器自身吞吐上限基准测试
+功能：在本进程内启动一个模拟 Claude API 的本地服务，用 ClaudeLoadTester 对其施压，
+测量每核最大 QPS、每请求客户端 CPU、每百万请求内存占用和启动耗时，
+并对比各 HTTP 传输后端 / 事件循环的 CPU 开销和延迟开销，结果输出为 JSON
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List
+
+import aiohttp
+
+from claude_load_test import ClaudeLoadTester
+from stand_in_server import StandInServer
+from transports import EVENT_LOOPS, TRANSPORTS, install_event_loop, require_optional
+
+
+def run_tester(tester: ClaudeLoadTester) -> float:
+    """运行一次测试（屏蔽输出），返回总耗时"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        asyncio.run(tester.run_test())
+        return time.perf_counter() - start
+
+
+def bench_throughput(endpoint: str, response_mode: str, concurrency: int, num_requests: int,
+                     transport: str = "aiohttp") -> Dict:
+    """测量吞吐和客户端 CPU（只统计主线程 CPU，模拟服务运行在其它线程）
+
+    模拟服务立即返回，测得的响应时间即客户端 + 本机回环的延迟开销
+    """
+    tester = ClaudeLoadTester(endpoint=endpoint, api_key="bench", concurrency=concurrency,
+                              total_requests=num_requests, response_mode=response_mode, transport=transport)
+    cpu_start = time.thread_time()
+    wall = run_tester(tester)
+    cpu = time.thread_time() - cpu_start
+
+    completed = tester.success_count + tester.failure_count
+    times = sorted(tester.response_times)
+    return {
+        "response_mode": response_mode,
+        "transport": transport,
+        "concurrency": concurrency,
+        "requests": completed,
+        "failures": tester.failure_count,
+        "wall_seconds": round(wall, 4),
+        "requests_per_second": round(completed / wall, 1) if wall > 0 else 0,
+        "client_cpu_seconds": round(cpu, 4),
+        "client_cpu_us_per_request": round(cpu / completed * 1e6, 1) if completed else 0,
+        "max_requests_per_second_per_core": round(completed / cpu, 1) if cpu > 0 else 0,
+        "client_saturated": tester.monitor.saturated_windows > 0,
+        "latency_mean_ms": round(sum(times) / len(times) * 1000, 3) if times else 0,
+        "latency_p50_ms": round(times[len(times) // 2] * 1000, 3) if times else 0,
+        "latency_p99_ms": round(times[min(len(times) - 1, int(len(times) * 0.99))] * 1000, 3) if times else 0,
+    }
+
+
+def available_backends(names: List[str]) -> List[str]:
+    """过滤掉未安装可选依赖的传输后端 / 事件循环"""
+    available = []
+    for name in names:
+        try:
+            if name in ("httpx", "uvloop"):
+                require_optional(name)
+            available.append(name)
+        except RuntimeError as e:
+            print(f"[跳过] {e}")
+    return available
+
+
+def bench_memory(endpoint: str, response_mode: str, concurrency: int, num_requests: int) -> Dict:
+    """用 tracemalloc 测量一次测试后仍被保留的内存，换算为每百万请求的占用"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tester = ClaudeLoadTester(endpoint=endpoint, api_key="bench", concurrency=concurrency,
+                              total_requests=num_requests, response_mode=response_mode)
+    run_tester(tester)
+    _, peak = tracemalloc.get_traced_memory()
+    retained = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    tracemalloc.stop()
+
+    completed = tester.success_count + tester.failure_count
+    return {
+        "response_mode": response_mode,
+        "concurrency": concurrency,
+        "requests": completed,
+        "retained_bytes": retained,
+        "peak_traced_bytes": peak,
+        "retained_mb_per_million_requests": round(retained / completed * 1e6 / 2**20, 1) if completed else 0,
+    }
+
+
+def bench_startup(repeats: int) -> Dict:
+    """测量解释器启动 + 导入 claude_load_test 的耗时，并扣除空解释器启动耗时"""
+    def measure(code: str) -> float:
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            samples.append(time.perf_counter() - start)
+        return sorted(samples)[len(samples) // 2]
+
+    baseline = measure("pass")
+    with_import = measure("import claude_load_test")
+    return {
+        "interpreter_ms": round(baseline * 1000, 1),
+        "import_ms": round((with_import - baseline) * 1000, 1),
+        "total_ms": round(with_import * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="ClaudeLoadTester 自身吞吐上限基准测试",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 默认配置，结果写入 benchmark_results.json
+  python benchmark_load_tester.py
+
+  # 指定并发级别和每组请求数
+  python benchmark_load_tester.py -c 1 10 100 -n 5000 -o results/$(git rev-parse --short HEAD).json
+
+  # 只对比传输后端和事件循环
+  python benchmark_load_tester.py --only-backends --transports aiohttp raw --loops asyncio uvloop
+        """
+    )
+    parser.add_argument("-c", "--concurrency", type=int, nargs="+", default=[1, 10, 50], help="并发级别 (默认: 1 10 50)")
+    parser.add_argument("-n", "--num-requests", type=int, default=2000, help="每组请求数 (默认: 2000)")
+    parser.add_argument("--modes", nargs="+", choices=ClaudeLoadTester.RESPONSE_MODES, default=list(ClaudeLoadTester.RESPONSE_MODES),
+                        help="响应处理模式 (默认: 全部)")
+    parser.add_argument("--response-bytes", type=int, default=2048, help="模拟响应中文本的字节数 (默认: 2048)")
+    parser.add_argument("--transports", nargs="+", choices=list(TRANSPORTS), default=list(TRANSPORTS),
+                        help="参与对比的传输后端，未安装的可选后端自动跳过 (默认: 全部)")
+    parser.add_argument("--loops", nargs="+", choices=EVENT_LOOPS, default=list(EVENT_LOOPS),
+                        help="参与对比的事件循环，未安装 uvloop 时自动跳过 (默认: 全部)")
+    parser.add_argument("--only-backends", action="store_true", help="只运行传输后端 / 事件循环对比")
+    parser.add_argument("--startup-repeats", type=int, default=5, help="启动耗时测量次数，取中位数 (默认: 5)")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="结果 JSON 文件 (默认: benchmark_results.json)")
+    args = parser.parse_args()
+
+    results: Dict[str, List[Dict]] = {"throughput": [], "memory": [], "backends": []}
+    transports = available_backends(args.transports)
+    loops = available_backends(args.loops)
+
+    with StandInServer(response_text_bytes=args.response_bytes) as server:
+        # 预热：建立连接池、触发各模块的惰性初始化
+        bench_throughput(server.endpoint, args.modes[0], 1, 50)
+
+        for mode in ([] if args.only_backends else args.modes):
+            for concurrency in args.concurrency:
+                result = bench_throughput(server.endpoint, mode, concurrency, args.num_requests)
+                results["throughput"].append(result)
+                print(f"[吞吐] {mode:<6} 并发 {concurrency:<4} {result['requests_per_second']:>9.1f} req/s  "
+                      f"{result['client_cpu_us_per_request']:>8.1f} µs/请求  "
+                      f"每核上限 {result['max_requests_per_second_per_core']:>9.1f} req/s"
+                      f"{'  (客户端饱和)' if result['client_saturated'] else ''}")
+
+            result = bench_memory(server.endpoint, mode, max(args.concurrency), args.num_requests)
+            results["memory"].append(result)
+            print(f"[内存] {mode:<6} 保留 {result['retained_bytes']:,} bytes / {result['requests']} 请求 "
+                  f"≈ {result['retained_mb_per_million_requests']} MB/百万请求")
+
+        # 传输后端 / 事件循环对比：低并发看延迟开销，高并发看每请求 CPU
+        for loop in loops:
+            install_event_loop(loop)
+            for transport in transports:
+                bench_throughput(server.endpoint, args.modes[0], 1, 50, transport=transport)
+                for concurrency in args.concurrency:
+                    result = bench_throughput(server.endpoint, args.modes[0], concurrency, args.num_requests,
+                                              transport=transport)
+                    result["event_loop"] = loop
+                    results["backends"].append(result)
+                    print(f"[后端] {loop:<7} {transport:<7} 并发 {concurrency:<4} "
+                          f"{result['client_cpu_us_per_request']:>8.1f} µs/请求  "
+                          f"延迟 平均 {result['latency_mean_ms']:>7.3f}ms P99 {result['latency_p99_ms']:>7.3f}ms  "
+                          f"{result['requests_per_second']:>9.1f} req/s")
+        install_event_loop("asyncio")
+
+    if not args.only_backends:
+        results["startup"] = bench_startup(args.startup_repeats)
+        print(f"[启动] 导入耗时 {results['startup']['import_ms']}ms (解释器 {results['startup']['interpreter_ms']}ms)")
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "aiohttp": aiohttp.__version__,
+        "cpu_count": os.cpu_count(),
+        "num_requests": args.num_requests,
+        "response_bytes": args.response_bytes,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,714 +7,614 @@ Claude 服务并发测试脚本
 import asyncio
 import aiohttp
 import argparse
+import base64
+import gzip
+import hashlib
+import heapq
+import itertools
+import math
+import os
 import time
 import json
 import random
-from collections import defaultdict
+import re
+import struct
+import sys
+import zlib
+from collections import defaultdict, deque
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+from yarl import URL
 
-class ClaudeLoadTester:
-    # 测试消息池 - 包含不同复杂度的测试样本（高Token版本）
-    TEST_MESSAGES = [
-        # 大型代码审查任务 1
-        """Please review the following e-commerce order processing system implementation and provide detailed feedback on architecture, security, performance, and best practices:
+from prompt_corpus import PromptCorpus
+from transports import (EVENT_LOOPS, TRANSPORTS, PhaseTimeout, RequestTimeouts, Transport, TransportError,
+                        TransportResponse, create_transport, install_event_loop, require_optional, wait_phase)
 
-```python
-import asyncio
-import logging
-from typing import List, Dict, Optional
-from datetime import datetime
-from dataclasses import dataclass
-from enum import Enum
-
-class OrderStatus(Enum):
-    PENDING = "pending"
-    PROCESSING = "processing"
-    PAYMENT_CONFIRMED = "payment_confirmed"
-    SHIPPED = "shipped"
-    DELIVERED = "delivered"
-    CANCELLED = "cancelled"
-    REFUNDED = "refunded"
-
-@dataclass
-class Product:
-    id: str
-    name: str
-    price: float
-    stock: int
-    category: str
-
-@dataclass
-class OrderItem:
-    product_id: str
-    quantity: int
-    price: float
-
-class OrderProcessor:
-    def __init__(self, db_connection, payment_gateway, inventory_service, notification_service):
-        self.db = db_connection
-        self.payment = payment_gateway
-        self.inventory = inventory_service
-        self.notifications = notification_service
-        self.logger = logging.getLogger(__name__)
-
-    async def create_order(self, user_id: str, items: List[OrderItem], shipping_address: Dict) -> str:
-        # Validate inventory
-        for item in items:
-            stock = await self.inventory.get_stock(item.product_id)
-            if stock < item.quantity:
-                raise ValueError(f"Insufficient stock for product {item.product_id}")
-
-        # Calculate total
-        total = sum(item.price * item.quantity for item in items)
-
-        # Create order in database
-        order_id = await self.db.insert_order({
-            'user_id': user_id,
-            'items': items,
-            'total': total,
-            'status': OrderStatus.PENDING.value,
-            'shipping_address': shipping_address,
-            'created_at': datetime.now()
-        })
-
-        # Reserve inventory
-        for item in items:
-            await self.inventory.reserve_stock(item.product_id, item.quantity)
-
-        return order_id
-
-    async def process_payment(self, order_id: str, payment_details: Dict) -> bool:
-        order = await self.db.get_order(order_id)
+# 默认测试提示词语料库 - 包含不同复杂度的测试样本（高Token版本）
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts", "default.corpus")
 
-        try:
-            payment_result = await self.payment.charge(
-                amount=order['total'],
-                currency='USD',
-                payment_method=payment_details
-            )
+# 进程退出码，便于自动化流程判断测试结果
+EXIT_OK = 0
+EXIT_SLO_ABORTED = 3  # SLO 守护触发并中止了测试
+EXIT_SLO_VIOLATED = 4  # SLO 守护触发（暂停退避），但测试跑完
+EXIT_CLIENT_SATURATED = 5  # 客户端饱和导致测试中止
 
-            if payment_result['status'] == 'success':
-                await self.db.update_order_status(order_id, OrderStatus.PAYMENT_CONFIRMED)
-                await self.notifications.send_email(
-                    order['user_id'],
-                    'Payment Confirmed',
-                    f'Your payment for order {order_id} has been confirmed'
-                )
-                return True
-            else:
-                await self.handle_payment_failure(order_id)
-                return False
 
-        except Exception as e:
-            self.logger.error(f"Payment processing failed: {e}")
-            await self.handle_payment_failure(order_id)
-            return False
-
-    async def handle_payment_failure(self, order_id: str):
-        order = await self.db.get_order(order_id)
-
-        # Release reserved inventory
-        for item in order['items']:
-            await self.inventory.release_stock(item['product_id'], item['quantity'])
-
-        await self.db.update_order_status(order_id, OrderStatus.CANCELLED)
-        await self.notifications.send_email(
-            order['user_id'],
-            'Order Cancelled',
-            f'Order {order_id} has been cancelled due to payment failure'
-        )
-
-    async def ship_order(self, order_id: str, tracking_number: str):
-        await self.db.update_order(order_id, {
-            'status': OrderStatus.SHIPPED.value,
-            'tracking_number': tracking_number,
-            'shipped_at': datetime.now()
-        })
-
-        order = await self.db.get_order(order_id)
-        await self.notifications.send_email(
-            order['user_id'],
-            'Order Shipped',
-            f'Your order {order_id} has been shipped. Tracking: {tracking_number}'
-        )
-```
-
-Please analyze:
-1. Potential race conditions and concurrency issues
-2. Error handling and transaction management
-3. Security vulnerabilities (e.g., SQL injection, price manipulation)
-4. Performance bottlenecks
-5. Missing validations or edge cases
-6. Suggested improvements and refactoring opportunities
-""",
-
-        # 大型系统设计问题
-        """Design a distributed rate limiting system for a high-traffic API gateway that serves millions of requests per second.
-
-Requirements:
-1. Support different rate limiting strategies (token bucket, leaky bucket, fixed window, sliding window)
-2. Per-user, per-IP, and per-API-key rate limiting
-3. Distributed across multiple data centers globally
-4. Low latency (<10ms overhead)
-5. High accuracy (>99% correct limiting decisions)
-6. Support for burst traffic
-7. Graceful degradation when backend systems fail
-8. Real-time monitoring and alerting
-9. Dynamic rate limit updates without service restart
-10. Cost-effective for billions of requests per day
-
-Please provide:
-- High-level architecture diagram explanation
-- Technology stack recommendations (databases, caching, message queues)
-- Data structures and algorithms for each rate limiting strategy
-- Handling of edge cases (clock skew, network partitions, cache inconsistency)
-- Scalability considerations
-- Monitoring and observability approach
-- Example implementation pseudocode for sliding window rate limiter
-- Trade-offs between different approaches
-""",
-
-        # 复杂数据处理任务
-        """Given the following complex nested JSON data representing a company's organizational structure and employee data, write a comprehensive Python solution to:
-
-```json
-{
-  "company": "TechCorp",
-  "departments": [
-    {
-      "id": "dept-001",
-      "name": "Engineering",
-      "budget": 5000000,
-      "manager": "emp-123",
-      "teams": [
-        {
-          "id": "team-001",
-          "name": "Backend",
-          "lead": "emp-456",
-          "members": [
-            {
-              "employee_id": "emp-456",
-              "name": "Alice Johnson",
-              "role": "Senior Backend Engineer",
-              "salary": 150000,
-              "skills": ["Python", "Go", "PostgreSQL", "Kubernetes"],
-              "projects": [
-                {"id": "proj-001", "name": "API Gateway", "hours": 120, "status": "active"},
-                {"id": "proj-002", "name": "Database Migration", "hours": 80, "status": "completed"}
-              ],
-              "performance_reviews": [
-                {"date": "2024-01-15", "rating": 4.5, "reviewer": "emp-123"},
-                {"date": "2024-07-15", "rating": 4.8, "reviewer": "emp-123"}
-              ]
-            },
-            {
-              "employee_id": "emp-789",
-              "name": "Bob Smith",
-              "role": "Backend Engineer",
-              "salary": 120000,
-              "skills": ["Java", "Spring Boot", "MySQL", "Redis"],
-              "projects": [
-                {"id": "proj-001", "name": "API Gateway", "hours": 160, "status": "active"}
-              ],
-              "performance_reviews": [
-                {"date": "2024-02-20", "rating": 4.2, "reviewer": "emp-456"}
-              ]
-            }
-          ]
-        },
-        {
-          "id": "team-002",
-          "name": "Frontend",
-          "lead": "emp-321",
-          "members": [
-            {
-              "employee_id": "emp-321",
-              "name": "Carol White",
-              "role": "Senior Frontend Engineer",
-              "salary": 145000,
-              "skills": ["React", "TypeScript", "GraphQL", "CSS"],
-              "projects": [
-                {"id": "proj-003", "name": "Dashboard Redesign", "hours": 200, "status": "active"}
-              ],
-              "performance_reviews": [
-                {"date": "2024-03-10", "rating": 4.6, "reviewer": "emp-123"}
-              ]
-            }
-          ]
-        }
-      ]
-    },
-    {
-      "id": "dept-002",
-      "name": "Product",
-      "budget": 3000000,
-      "manager": "emp-111",
-      "teams": [
-        {
-          "id": "team-003",
-          "name": "Product Management",
-          "lead": "emp-111",
-          "members": [
-            {
-              "employee_id": "emp-111",
-              "name": "David Brown",
-              "role": "VP of Product",
-              "salary": 200000,
-              "skills": ["Product Strategy", "User Research", "Roadmapping"],
-              "projects": [
-                {"id": "proj-004", "name": "Q4 Product Roadmap", "hours": 100, "status": "active"}
-              ],
-              "performance_reviews": [
-                {"date": "2024-01-05", "rating": 4.9, "reviewer": "CEO"}
-              ]
-            }
-          ]
-        }
-      ]
-    }
-  ]
-}
-```
-
-Tasks:
-1. Calculate total salary expenditure per department and team
-2. Find top 5 employees by average performance rating
-3. List all employees working on active projects with their total hours
-4. Generate a skills matrix showing which skills are most common
-5. Calculate the average salary by role
-6. Find employees who are overallocated (>160 hours across all active projects)
-7. Generate a report of all projects with their team members and total hours
-8. Find the department with the best average performance ratings
-9. List employees due for performance review (last review >6 months ago)
-10. Calculate budget utilization percentage per department
-
-Provide efficient, clean, well-documented Python code with proper error handling.
-""",
-
-        # 算法优化问题
-        """I have a performance-critical system that processes millions of log entries per second. Each log entry contains:
-- timestamp (Unix timestamp in milliseconds)
-- user_id (string, 32 characters)
-- event_type (enum: LOGIN, LOGOUT, PAGE_VIEW, API_CALL, ERROR)
-- metadata (JSON object, variable size up to 1KB)
-
-Current implementation:
-```python
-class LogProcessor:
+class UsageScanner:
+    """增量扫描响应体，只提取 usage 和 stop_reason，避免构建完整的 JSON 对象"""
+
+    # 跨分块保留的尾部字节数，需大于任意一个被匹配字段的长度
+    CARRY_BYTES = 128
+
+    INPUT_TOKENS_RE = re.compile(rb'"input_tokens"\s*:\s*(\d+)(?=\D)')
+    OUTPUT_TOKENS_RE = re.compile(rb'"output_tokens"\s*:\s*(\d+)(?=\D)')
+    STOP_REASON_RE = re.compile(rb'"stop_reason"\s*:\s*(?:null|"([^"\\]*)")')
+
     def __init__(self):
-        self.logs = []
-        self.user_sessions = {}
-        self.event_counts = {}
-
-    def process_log(self, log_entry):
-        # Add to memory
-        self.logs.append(log_entry)
-
-        # Update user session
-        user_id = log_entry['user_id']
-        if user_id not in self.user_sessions:
-            self.user_sessions[user_id] = []
-        self.user_sessions[user_id].append(log_entry)
-
-        # Update event counts
-        event_type = log_entry['event_type']
-        if event_type not in self.event_counts:
-            self.event_counts[event_type] = 0
-        self.event_counts[event_type] += 1
-
-    def get_user_events(self, user_id, start_time, end_time):
-        if user_id not in self.user_sessions:
-            return []
-        return [
-            log for log in self.user_sessions[user_id]
-            if start_time <= log['timestamp'] <= end_time
-        ]
-
-    def get_event_count(self, event_type):
-        return self.event_counts.get(event_type, 0)
-
-    def get_recent_errors(self, last_n_minutes):
-        cutoff = time.time() * 1000 - (last_n_minutes * 60 * 1000)
-        return [
-            log for log in self.logs
-            if log['event_type'] == 'ERROR' and log['timestamp'] >= cutoff
-        ]
-```
-
-Problems:
-1. Memory usage grows unbounded - crashes after a few hours
-2. Query performance degrades over time (get_user_events takes >10 seconds after 1M logs)
-3. get_recent_errors scans entire log list every time
-4. No persistence - data lost on restart
-5. Not thread-safe for concurrent processing
-6. No cleanup of old data
-
-Please design and implement a better solution that:
-- Handles millions of logs per second efficiently
-- Keeps memory usage bounded (max 10GB)
-- Maintains fast query performance (queries <100ms)
-- Persists data to disk reliably
-- Supports concurrent processing
-- Automatically cleans up old data (>30 days)
-- Provides aggregate statistics (events per minute, unique users, error rates)
-
-Include specific data structures, algorithms, and code implementation.
-""",
-
-        # 数据库设计问题
-        """Design a database schema for a social media platform similar to Twitter/X with the following features:
-
-Core Features:
-1. Users can post tweets (max 280 characters) with optional media (images, videos)
-2. Users can follow/unfollow other users
-3. Users can like, retweet, quote tweets, and reply to tweets
-4. Real-time timeline showing tweets from followed users
-5. Trending topics and hashtags
-6. Direct messaging between users
-7. Notifications (likes, retweets, mentions, new followers)
-8. User profiles with bio, avatar, banner, location
-9. Tweet search with filters (date range, user, hashtags, media type)
-10. Analytics (impressions, engagement rate, follower growth)
-
-Scale Requirements:
-- 500 million users
-- 200 million daily active users
-- 500 million tweets per day
-- Average user follows 200 people
-- Support for 10,000 tweets per second during peak
-- Timeline queries must return in <200ms
-- Search queries must return in <500ms
-
-Please provide:
-1. Complete database schema with all tables and relationships
-2. Indexing strategy for optimal query performance
-3. Partitioning/sharding strategy for horizontal scaling
-4. Caching strategy (what to cache, invalidation approach)
-5. How to handle the timeline query efficiently (fan-out on write vs fan-out on read)
-6. How to implement trending topics calculation
-7. Storage optimization for media files
-8. Database technology choices (SQL vs NoSQL, which databases for which use cases)
-9. Sample queries for common operations with explain plans
-10. Migration strategy for schema changes with zero downtime
-
-Include SQL DDL statements, query examples, and architectural diagrams explanation.
-""",
-
-        # 微服务架构设计
-        """Design a microservices architecture for an online food delivery platform similar to UberEats/DoorDash.
-
-Business Requirements:
-1. Customer app: Browse restaurants, place orders, track delivery, rate restaurants
-2. Restaurant app: Receive orders, update menu, manage availability
-3. Driver app: Accept deliveries, navigate, update delivery status
-4. Admin dashboard: Monitor operations, handle disputes, analytics
-
-Technical Requirements:
-1. Handle 100,000 concurrent users
-2. Process 10,000 orders per hour during peak
-3. Real-time order tracking (location updates every 5 seconds)
-4. 99.9% uptime SLA
-5. Support multiple payment methods
-6. Integration with third-party services (maps, payments, SMS)
-7. Multi-region deployment (US, EU, APAC)
-8. GDPR and PCI-DSS compliance
-
-Please design:
-1. Microservice boundaries (which services, what responsibilities)
-2. Communication patterns (sync vs async, REST vs gRPC vs message queues)
-3. Data storage strategy (which database for which service)
-4. Event-driven architecture for order lifecycle
-5. Real-time location tracking implementation
-6. Payment processing flow with failure handling
-7. API gateway configuration and rate limiting
-8. Service discovery and load balancing
-9. Circuit breakers and retry policies
-10. Monitoring, logging, and distributed tracing setup
-11. Deployment strategy (Kubernetes, service mesh)
-12. Security implementation (authentication, authorization, encryption)
-
-Include:
-- Architecture diagram explanation
-- API contracts for key services
-- Event schemas for async communication
-- Database schemas for each service
-- Sequence diagrams for critical flows (order placement, delivery tracking)
-- Failure scenarios and mitigation strategies
-- Performance optimization techniques
-""",
-
-        # 安全审计问题
-        """Perform a comprehensive security audit of the following authentication and authorization system:
-
-```python
-from flask import Flask, request, jsonify, session
-import hashlib
-import sqlite3
-import jwt
-import datetime
-
-app = Flask(__name__)
-app.secret_key = "my-secret-key-12345"
-
-def get_db():
-    conn = sqlite3.connect('users.db')
-    return conn
-
-@app.route('/api/register', methods=['POST'])
-def register():
-    data = request.get_json()
-    username = data['username']
-    password = data['password']
-    email = data.get('email', '')
-
-    # Hash password
-    password_hash = hashlib.md5(password.encode()).hexdigest()
-
-    # Insert into database
-    db = get_db()
-    cursor = db.cursor()
-    query = f"INSERT INTO users (username, password, email, role) VALUES ('{username}', '{password_hash}', '{email}', 'user')"
-    cursor.execute(query)
-    db.commit()
-    db.close()
-
-    return jsonify({"message": "User registered successfully"})
-
-@app.route('/api/login', methods=['POST'])
-def login():
-    data = request.get_json()
-    username = data['username']
-    password = data['password']
-
-    password_hash = hashlib.md5(password.encode()).hexdigest()
-
-    db = get_db()
-    cursor = db.cursor()
-    query = f"SELECT * FROM users WHERE username='{username}' AND password='{password_hash}'"
-    cursor.execute(query)
-    user = cursor.fetchone()
-    db.close()
-
-    if user:
-        # Create JWT token
-        token = jwt.encode({
-            'user_id': user[0],
-            'username': user[1],
-            'role': user[4],
-            'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-        }, 'jwt-secret-key', algorithm='HS256')
-
-        session['user_id'] = user[0]
-
-        return jsonify({"token": token, "message": "Login successful"})
-    else:
-        return jsonify({"message": "Invalid credentials"}), 401
-
-@app.route('/api/users/<user_id>', methods=['GET'])
-def get_user(user_id):
-    token = request.headers.get('Authorization')
-
-    if not token:
-        return jsonify({"message": "No token provided"}), 403
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.stop_reason: Optional[str] = None
+        self.total_bytes = 0
+        self._carry = b""
+
+    def feed(self, chunk: bytes):
+        """处理一个响应分块（同一字段出现多次时以最后一次为准）"""
+        self.total_bytes += len(chunk)
+        window = self._carry + chunk
 
+        for match in self.INPUT_TOKENS_RE.finditer(window):
+            self.input_tokens = int(match.group(1))
+        for match in self.OUTPUT_TOKENS_RE.finditer(window):
+            self.output_tokens = int(match.group(1))
+        for match in self.STOP_REASON_RE.finditer(window):
+            self.stop_reason = match.group(1).decode() if match.group(1) is not None else None
+
+        self._carry = window[-self.CARRY_BYTES:]
+
+
+def describe_http_error(status: int, error_text: str) -> str:
+    """把非 200 响应整理为错误描述（优先使用 API 返回的错误类型和消息）"""
     try:
-        decoded = jwt.decode(token.replace('Bearer ', ''), 'jwt-secret-key', algorithms=['HS256'])
+        error_json = json.loads(error_text)
+        return f"HTTP {status}: {error_json.get('error', {}).get('type', 'unknown')} - {error_json.get('error', {}).get('message', error_text[:100])}"
     except:
-        return jsonify({"message": "Invalid token"}), 403
-
-    db = get_db()
-    cursor = db.cursor()
-    query = f"SELECT username, email, role FROM users WHERE id={user_id}"
-    cursor.execute(query)
-    user = cursor.fetchone()
-    db.close()
-
-    if user:
-        return jsonify({
-            "username": user[0],
-            "email": user[1],
-            "role": user[2]
-        })
-    else:
-        return jsonify({"message": "User not found"}), 404
-
-@app.route('/api/users/<user_id>/update', methods=['POST'])
-def update_user(user_id):
-    token = request.headers.get('Authorization')
-
-    if not token:
-        return jsonify({"message": "No token provided"}), 403
-
-    decoded = jwt.decode(token.replace('Bearer ', ''), 'jwt-secret-key', algorithms=['HS256'])
-
-    data = request.get_json()
-
-    db = get_db()
-    cursor = db.cursor()
-
-    # Update user fields
-    if 'email' in data:
-        query = f"UPDATE users SET email='{data['email']}' WHERE id={user_id}"
-        cursor.execute(query)
-
-    if 'role' in data:
-        query = f"UPDATE users SET role='{data['role']}' WHERE id={user_id}"
-        cursor.execute(query)
-
-    db.commit()
-    db.close()
-
-    return jsonify({"message": "User updated successfully"})
-
-@app.route('/api/admin/users', methods=['GET'])
-def admin_get_users():
-    token = request.headers.get('Authorization')
-    decoded = jwt.decode(token.replace('Bearer ', ''), 'jwt-secret-key', algorithms=['HS256'])
-
-    if decoded['role'] != 'admin':
-        return jsonify({"message": "Unauthorized"}), 403
-
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("SELECT id, username, email, role FROM users")
-    users = cursor.fetchall()
-    db.close()
-
-    return jsonify({"users": users})
-
-if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0')
-```
-
-Please identify and explain:
-1. All security vulnerabilities (SQL injection, XSS, CSRF, etc.)
-2. Authentication and authorization weaknesses
-3. Cryptographic issues
-4. Session management problems
-5. Input validation gaps
-6. Information disclosure risks
-7. Missing security headers
-8. Logging and monitoring gaps
-9. Rate limiting and DoS vulnerabilities
-10. Compliance issues (GDPR, OWASP Top 10)
-
-For each vulnerability, provide:
-- Severity rating (Critical, High, Medium, Low)
-- Exploitation scenario
-- Impact assessment
-- Detailed fix with secure code example
-- Additional security best practices recommendations
-""",
-
-        # 性能优化问题
-        """Optimize the following slow-performing web application backend:
-
-Current System:
-- Flask web server with 10 workers
-- PostgreSQL database (single instance, 16GB RAM, 8 cores)
-- Redis cache (2GB)
-- Average response time: 3-5 seconds
-- Peak load: 1000 requests per second
-- Database has 50 million records in main table
-
-Problem Code:
-```python
-@app.route('/api/search')
-def search():
-    query = request.args.get('q', '')
-    category = request.args.get('category', '')
-    page = int(request.args.get('page', 1))
-    per_page = 50
-
-    # Database query
-    sql = '''
-        SELECT p.*, c.name as category_name, u.username as seller_name
-        FROM products p
-        JOIN categories c ON p.category_id = c.id
-        JOIN users u ON p.seller_id = u.id
-        WHERE p.title LIKE %s OR p.description LIKE %s
-    '''
-
-    params = [f'%{query}%', f'%{query}%']
-
-    if category:
-        sql += ' AND c.name = %s'
-        params.append(category)
-
-    sql += ' ORDER BY p.created_at DESC LIMIT %s OFFSET %s'
-    params.extend([per_page, (page - 1) * per_page])
-
-    cursor = db.execute(sql, params)
-    products = cursor.fetchall()
-
-    # Get review counts and ratings for each product
-    for product in products:
-        reviews_sql = 'SELECT COUNT(*), AVG(rating) FROM reviews WHERE product_id = %s'
-        review_data = db.execute(reviews_sql, [product['id']]).fetchone()
-        product['review_count'] = review_data[0]
-        product['avg_rating'] = review_data[1]
-
-        # Get seller info
-        seller_sql = 'SELECT username, avatar_url, rating FROM users WHERE id = %s'
-        seller = db.execute(seller_sql, [product['seller_id']]).fetchone()
-        product['seller'] = seller
-
-        # Check if in user's wishlist
-        if current_user:
-            wishlist_sql = 'SELECT 1 FROM wishlists WHERE user_id = %s AND product_id = %s'
-            in_wishlist = db.execute(wishlist_sql, [current_user.id, product['id']]).fetchone()
-            product['in_wishlist'] = bool(in_wishlist)
-
-    # Get total count for pagination
-    count_sql = 'SELECT COUNT(*) FROM products p JOIN categories c ON p.category_id = c.id WHERE p.title LIKE %s OR p.description LIKE %s'
-    count_params = [f'%{query}%', f'%{query}%']
-    if category:
-        count_sql += ' AND c.name = %s'
-        count_params.append(category)
-
-    total = db.execute(count_sql, count_params).fetchone()[0]
-
-    return jsonify({
-        'products': products,
-        'total': total,
-        'page': page,
-        'pages': (total + per_page - 1) // per_page
-    })
-```
-
-Issues:
-1. N+1 query problem (database calls in loop)
-2. No proper indexing
-3. LIKE queries are slow on large tables
-4. No caching strategy
-5. Fetching data not always needed
-6. No connection pooling
-7. Synchronous I/O blocking
-8. No query result pagination optimization
-
-Provide optimized solution with:
-1. Rewritten SQL with proper JOINs
-2. Index recommendations
-3. Caching strategy (what to cache, when to invalidate)
-4. Database query optimization techniques
-5. Application code improvements
-6. Asynchronous processing where applicable
-7. Load testing results comparison
-8. Monitoring and profiling approach
-9. Scalability recommendations
-10. Cost-performance trade-offs analysis
-"""
+        return f"HTTP {status}: {error_text[:100]}"
+
+
+def parse_server_time(header: str, value: str) -> Optional[float]:
+    """把服务端耗时响应头解析为秒
+
+    server-timing 取各项中最大的 dur（通常为总耗时，单位 ms），其它响应头按毫秒数值解析
+    （允许带 "ms" 后缀；带 "s" 后缀时按秒解析）
+    """
+    try:
+        if header == "server-timing":
+            durations = [float(param.split("=", 1)[1]) for metric in value.split(",") for param in metric.split(";")[1:]
+                         if param.strip().startswith("dur=")]
+            return max(durations) / 1000 if durations else None
+        value = value.strip().lower()
+        if value.endswith("ms"):
+            return float(value[:-2]) / 1000
+        if value.endswith("s"):
+            return float(value[:-1])
+        return float(value) / 1000
+    except ValueError:
+        return None
+
+
+def parse_hedge_delay(value: str) -> Tuple[float, int]:
+    """解析 --hedge-delay：'p95' 表示已观测延迟的百分位，'500ms' / '2s' / '1.5' 表示固定延迟（秒）
+
+    返回 (固定延迟秒数, 百分位)，两者只有一个非 0
+    """
+    value = value.strip().lower()
+    try:
+        if value.startswith("p"):
+            percentile = int(value[1:])
+            if not 0 < percentile < 100:
+                raise ValueError
+            return 0.0, percentile
+        if value.endswith("ms"):
+            delay = float(value[:-2]) / 1000
+        else:
+            delay = float(value[:-1] if value.endswith("s") else value)
+        if delay <= 0:
+            raise ValueError
+        return delay, 0
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的对冲延迟 '{value}'，例如 p95、500ms、2s")
+
+
+class SaturationMonitor:
+    """负载生成器自身的饱和检测：事件循环延迟、进程 CPU、发送延迟、JSON/打印耗时"""
+
+    # 饱和时的处理方式: warn - 仅在结果中告警; throttle - 暂停发送直到恢复; abort - 停止测试
+    ACTIONS = ("warn", "throttle", "abort")
+
+    def __init__(self, max_loop_lag_ms: float = 50, max_cpu_percent: float = 90, max_send_lag_ms: float = 50,
+                 action: str = "warn", interval: float = 0.05, window: float = 1.0):
+        self.max_loop_lag = max_loop_lag_ms / 1000
+        self.max_cpu_percent = max_cpu_percent
+        self.max_send_lag = max_send_lag_ms / 1000
+        self.action = action
+        self.interval = interval
+        self.window = window
+
+        self.loop_lags = []  # 每次采样的事件循环延迟
+        self.send_lags = []  # 实际发送时间 - 计划发送时间
+        self.cpu_samples = []  # 每个窗口的进程 CPU 使用率（%）
+        self.json_time = 0.0  # 序列化请求 / 解析响应的累计耗时
+        self.print_time = 0.0  # 打印进度的累计耗时
+        self.saturated = False  # 最近一个窗口是否饱和
+        self.saturated_windows = 0
+        self.total_windows = 0
+        self.first_reason = ""
+
+    def record_send(self, scheduled_time: float, actual_time: float):
+        """记录一次发送的计划时间与实际时间"""
+        self.send_lags.append(max(0.0, actual_time - scheduled_time))
+
+    async def run(self, on_saturated=None):
+        """采样协程：周期性 sleep 并测量超出部分，作为事件循环延迟"""
+        window_start = time.perf_counter()
+        cpu_start = time.process_time()
+        window_lag = 0.0
+        send_index = 0
+
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - t0 - self.interval)
+            self.loop_lags.append(lag)
+            window_lag = max(window_lag, lag)
+
+            if now - window_start < self.window:
+                continue
+
+            # 一个窗口结束，汇总 CPU 与发送延迟
+            cpu_percent = (time.process_time() - cpu_start) / (now - window_start) * 100
+            self.cpu_samples.append(cpu_percent)
+            window_send_lag = max(self.send_lags[send_index:], default=0.0)
+            send_index = len(self.send_lags)
+
+            reasons = []
+            if window_lag > self.max_loop_lag:
+                reasons.append(f"事件循环延迟 {window_lag*1000:.1f}ms > {self.max_loop_lag*1000:.0f}ms")
+            if cpu_percent > self.max_cpu_percent:
+                reasons.append(f"进程 CPU {cpu_percent:.0f}% > {self.max_cpu_percent:.0f}%")
+            if window_send_lag > self.max_send_lag:
+                reasons.append(f"发送延迟 {window_send_lag*1000:.1f}ms > {self.max_send_lag*1000:.0f}ms")
+
+            self.total_windows += 1
+            self.saturated = bool(reasons)
+            if self.saturated:
+                self.saturated_windows += 1
+                if not self.first_reason:
+                    self.first_reason = "; ".join(reasons)
+                if on_saturated is not None:
+                    on_saturated("; ".join(reasons))
+
+            window_start = now
+            cpu_start = time.process_time()
+            window_lag = 0.0
+
+    def print_stats(self):
+        """打印客户端自检结果，饱和时给出明确告警"""
+        print(f"\n客户端自检:")
+        if self.loop_lags:
+            sorted_lags = sorted(self.loop_lags)
+            print(f"  事件循环延迟: P50 {sorted_lags[len(sorted_lags)//2]*1000:.2f}ms / "
+                  f"P99 {sorted_lags[int(len(sorted_lags)*0.99)]*1000:.2f}ms / 最大 {sorted_lags[-1]*1000:.2f}ms")
+        if self.cpu_samples:
+            print(f"  进程 CPU: 平均 {sum(self.cpu_samples)/len(self.cpu_samples):.0f}% / 峰值 {max(self.cpu_samples):.0f}%")
+        if self.send_lags:
+            late = sum(1 for lag in self.send_lags if lag > self.max_send_lag)
+            print(f"  发送延迟: 最大 {max(self.send_lags)*1000:.2f}ms, "
+                  f"超过 {self.max_send_lag*1000:.0f}ms 的发送 {late}/{len(self.send_lags)} ({late/len(self.send_lags)*100:.1f}%)")
+        print(f"  JSON 处理耗时: {self.json_time*1000:.0f}ms")
+        print(f"  打印耗时: {self.print_time*1000:.0f}ms")
+
+        if self.saturated_windows:
+            print(f"\n  ⚠️  客户端已饱和，结果不可靠！ ({self.saturated_windows}/{self.total_windows} 个采样窗口超过阈值)")
+            print(f"  首次触发: {self.first_reason}")
+            print(f"  建议: 降低并发数、使用 --response-mode usage 或将负载分散到多个进程/机器")
+
+
+class ConversationSession:
+    """虚拟用户的多轮会话：每轮追加助手的实际回复和一条追问，上下文随轮次增长"""
+
+    def __init__(self, first_prompt: str):
+        self.messages = [{"role": "user", "content": first_prompt}]
+        self.turn = 0  # 已完成的轮数
+        self.last_input_tokens = 0
+
+    def add_reply(self, content: Optional[List[Dict]], input_tokens: int):
+        """追加助手回复（空回复用占位文本，避免 API 拒绝空的 assistant 消息）"""
+        self.messages.append({"role": "assistant", "content": content or "(empty response)"})
+        self.turn += 1
+        self.last_input_tokens = input_tokens
+
+    def add_follow_up(self, prompt: str):
+        self.messages.append({"role": "user", "content": prompt})
+
+    def add_tool_results(self, result_text: str) -> int:
+        """为上一条助手回复中的每个 tool_use 块回填合成的 tool_result，返回回填数量（0 表示模型未调用工具）"""
+        content = self.messages[-1]["content"]
+        tool_uses = [block for block in content if block.get("type") == "tool_use"] if isinstance(content, list) else []
+        if tool_uses:
+            self.messages.append({"role": "user", "content": [
+                {"type": "tool_result", "tool_use_id": block["id"], "content": result_text} for block in tool_uses
+            ]})
+        return len(tool_uses)
+
+
+class RequestScenarios:
+    """请求场景混合：按权重为每个请求（工具循环为每个循环）选择场景
+
+    text      - 语料库中的纯文本提示词（默认行为）
+    tools     - 同样的提示词，附带大量工具定义
+    tool-loop - 多步工具循环: 强制模型调用工具，回填合成的 tool_result 后继续，直到达到步数或模型结束
+    image     - 提示词前附带一张 base64 编码的 PNG 图片
+
+    工具定义和图片在启动时生成并预先编码，构建请求体时直接拼接
+    """
+
+    NAMES = ("text", "tools", "tool-loop", "image")
+
+    # 合成工具定义的模板: (名称, 描述, 参数)
+    TOOL_TEMPLATES = [
+        ("search_documents", "Full-text search over the internal knowledge base. Returns the most relevant passages "
+         "with their document ids, titles and relevance scores. Use this before answering any question about "
+         "internal systems, policies or past incidents.",
+         {"query": {"type": "string", "description": "Search query in natural language"},
+          "top_k": {"type": "integer", "minimum": 1, "maximum": 50, "description": "Number of passages to return"},
+          "filters": {"type": "object", "description": "Optional metadata filters",
+                      "properties": {"team": {"type": "string"}, "updated_after": {"type": "string", "format": "date"},
+                                     "doc_type": {"type": "string", "enum": ["runbook", "design", "postmortem", "faq"]}}}}),
+        ("read_file", "Read a file from the repository checkout. Large files are truncated; use offset and limit "
+         "to page through them. Binary files are returned as a short summary instead of raw content.",
+         {"path": {"type": "string", "description": "Path relative to the repository root"},
+          "offset": {"type": "integer", "minimum": 0, "description": "First line to return"},
+          "limit": {"type": "integer", "minimum": 1, "maximum": 5000, "description": "Maximum number of lines"}}),
+        ("run_sql_query", "Execute a read-only SQL query against the analytics warehouse and return up to max_rows "
+         "rows as JSON. Queries that scan more than the configured byte budget are rejected.",
+         {"sql": {"type": "string", "description": "A single SELECT statement"},
+          "max_rows": {"type": "integer", "minimum": 1, "maximum": 10000},
+          "timeout_seconds": {"type": "number", "minimum": 1, "maximum": 300},
+          "dataset": {"type": "string", "enum": ["prod_events", "billing", "usage_daily", "experiments"]}}),
+        ("http_request", "Send an HTTP request to an allow-listed internal service and return status, headers "
+         "and body. Use it to check service health, fetch configuration or call internal APIs.",
+         {"method": {"type": "string", "enum": ["GET", "POST", "PUT", "DELETE"]},
+          "url": {"type": "string", "description": "Absolute URL of an allow-listed service"},
+          "headers": {"type": "object", "additionalProperties": {"type": "string"}},
+          "body": {"type": "string", "description": "Request body for POST / PUT"}}),
+        ("create_ticket", "Create a ticket in the issue tracker with a title, description, priority and labels. "
+         "Returns the ticket id and URL. Duplicate detection is applied on the title.",
+         {"title": {"type": "string", "maxLength": 200},
+          "description": {"type": "string"},
+          "priority": {"type": "string", "enum": ["P0", "P1", "P2", "P3"]},
+          "labels": {"type": "array", "items": {"type": "string"}, "maxItems": 10},
+          "assignee": {"type": "string", "description": "Username of the assignee"}}),
+        ("get_metrics", "Fetch time-series metrics for a service from the monitoring system, aggregated over the "
+         "requested step. Supports latency percentiles, error rates, throughput and saturation signals.",
+         {"service": {"type": "string"},
+          "metric": {"type": "string", "enum": ["latency_p50", "latency_p99", "error_rate", "rps", "cpu", "memory"]},
+          "start": {"type": "string", "format": "date-time"},
+          "end": {"type": "string", "format": "date-time"},
+          "step_seconds": {"type": "integer", "minimum": 10}}),
+    ]
+
+    def __init__(self, weights: List[Tuple[str, float]], tool_count: int = 16, tool_loop_steps: int = 4,
+                 tool_result_bytes: int = 4096, image_bytes: int = 256 * 1024):
+        self.weights = weights
+        self.tool_count = tool_count
+        self.tool_loop_steps = tool_loop_steps  # 工具循环最多的请求数（最后一步不再强制调用工具）
+        self.tool_result_bytes = tool_result_bytes
+        self.image_bytes = image_bytes
+        self._names = [name for name, _ in weights]
+        self._cum_weights = list(itertools.accumulate(weight for _, weight in weights))
+
+        self.tools = self.build_tools(tool_count)
+        self.encoded_tools = json.dumps(self.tools).encode()
+        self.tool_result_text = self.build_tool_result(tool_result_bytes)
+        image = self.build_png(image_bytes)
+        self.image_size = len(image)
+        self.encoded_image_block = json.dumps({"type": "image", "source": {
+            "type": "base64", "media_type": "image/png", "data": base64.b64encode(image).decode()}}).encode()
+
+    @classmethod
+    def parse(cls, spec: str) -> Tuple[str, float]:
+        """解析 <场景>[:<权重>]，格式错误时抛出 argparse.ArgumentTypeError"""
+        name, _, weight = spec.partition(":")
+        name = name.strip()
+        if name not in cls.NAMES:
+            raise argparse.ArgumentTypeError(f"无效的请求场景 '{spec}'，可选: {', '.join(cls.NAMES)}")
+        try:
+            value = float(weight) if weight.strip() else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"无效的场景权重 '{spec}'")
+        if value <= 0:
+            raise argparse.ArgumentTypeError(f"场景权重必须大于 0: '{spec}'")
+        return name, value
+
+    def choose(self) -> str:
+        return random.choices(self._names, cum_weights=self._cum_weights)[0]
+
+    def describe(self) -> str:
+        total = self._cum_weights[-1]
+        return ", ".join(f"{name} {weight / total * 100:.0f}%" for name, weight in self.weights)
+
+    @classmethod
+    def build_tools(cls, count: int) -> List[Dict]:
+        """按模板生成 count 个工具定义，超出模板数量时加序号后缀"""
+        tools = []
+        for i in range(count):
+            name, description, properties = cls.TOOL_TEMPLATES[i % len(cls.TOOL_TEMPLATES)]
+            suffix = f"_{i // len(cls.TOOL_TEMPLATES) + 1}" if i >= len(cls.TOOL_TEMPLATES) else ""
+            tools.append({
+                "name": name + suffix,
+                "description": description,
+                "input_schema": {"type": "object", "properties": properties, "required": [next(iter(properties))]},
+            })
+        return tools
+
+    @staticmethod
+    def build_tool_result(size: int) -> str:
+        """生成约 size 字节的合成工具输出（类似查询结果的 JSON 行）"""
+        lines = []
+        total = 0
+        for i in itertools.count():
+            line = json.dumps({"row": i, "service": f"svc-{i % 17}", "status": ("ok", "degraded", "error")[i % 3],
+                               "latency_ms": (i * 37) % 1000, "note": "synthetic tool output for load testing"})
+            if total + len(line) > size and lines:
+                break
+            lines.append(line)
+            total += len(line) + 1
+        return "\n".join(lines)
+
+    @staticmethod
+    def build_png(size: int) -> bytes:
+        """生成约 size 字节的 RGB 噪声 PNG（固定种子，噪声不可压缩，文件大小约等于像素数据大小）"""
+        side = max(8, int(math.sqrt(size / 3)))
+        rng = random.Random(0)
+        row_bytes = side * 3
+        raw = b"".join(b"\x00" + rng.getrandbits(row_bytes * 8).to_bytes(row_bytes, "little") for _ in range(side))
+
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+        return (b"\x89PNG\r\n\x1a\n"
+                + chunk(b"IHDR", struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0))
+                + chunk(b"IDAT", zlib.compress(raw, 1))
+                + chunk(b"IEND", b""))
+
+
+class TraceReader:
+    """流式读取带时间戳的请求日志（JSONL，可为 .gz），逐行产出 (相对首条的偏移秒数, 条目)，不整体加载到内存
+
+    每行是一个 JSON 对象，时间字段为 epoch 秒数或 ISO 8601 字符串；可选 "body"（完整请求体）
+    或 "prompt"（用户消息文本），都没有时从语料库随机选择
+    """
+
+    def __init__(self, path: str, time_field: str = "timestamp"):
+        self.path = path
+        self.time_field = time_field
+        self.skipped = 0  # 无法解析的行数
+
+    @staticmethod
+    def parse_timestamp(value) -> float:
+        if isinstance(value, (int, float)):
+            return float(value)
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+    def __iter__(self) -> Iterator[Tuple[float, Dict]]:
+        opener = gzip.open if self.path.endswith(".gz") else open
+        first = None
+        with opener(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    ts = self.parse_timestamp(entry[self.time_field])
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    self.skipped += 1
+                    continue
+                if "body" in entry and not isinstance(entry["body"], dict):
+                    # 例如网关日志把请求体存成转义后的字符串
+                    self.skipped += 1
+                    continue
+
+                if first is None:
+                    first = ts
+                yield ts - first, entry
+
+
+class BatchSource:
+    """流式读取批次请求来源（JSONL），逐行产出 (custom_id, 条目)，跳过无法解析的行并计数
+
+    每行是一个 JSON 对象 {"custom_id"?, "prompt" | "body"}，custom_id 缺省为 req-<行序号>
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.skipped = 0  # 无法解析的行数
+
+    def __iter__(self) -> Iterator[Tuple[str, Dict]]:
+        with open(self.path, encoding="utf-8") as f:
+            for i, line in enumerate(line for line in f if line.strip()):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    self.skipped += 1
+                    continue
+                if not isinstance(entry, dict) or ("body" in entry and not isinstance(entry["body"], dict)):
+                    self.skipped += 1
+                    continue
+                yield entry.get("custom_id", f"req-{i}"), entry
+
+
+class SloGuard:
+    """SLO 守护规则：在滚动窗口内检查指标，超过阈值时中止、取消在途请求或暂停退避
+
+    规则格式: <指标>><阈值>[:<动作>]，例如 error_rate>5%、p95>20s:pause、tokens>2000000:cancel
+    """
+
+    METRICS = ("error_rate", "p50", "p90", "p95", "p99", "tokens")
+    # abort - 停止发送剩余请求; cancel - 同时取消在途请求; pause - 暂停发送并指数退避
+    ACTIONS = ("abort", "cancel", "pause")
+
+    def __init__(self, metric: str, threshold: float, action: str = "abort"):
+        self.metric = metric
+        self.threshold = threshold  # error_rate 为百分比，延迟为秒，tokens 为累计数量
+        self.action = action
+        self.fired_count = 0
+        self.first_fired_at: Optional[float] = None  # 相对测试开始的秒数
+        self.fired_value: Optional[float] = None
+
+    @classmethod
+    def parse(cls, spec: str) -> "SloGuard":
+        """解析命令行规则，格式错误时抛出 argparse.ArgumentTypeError"""
+        rule, _, action = spec.partition(":")
+        metric, sep, threshold = rule.partition(">")
+        metric, threshold, action = metric.strip(), threshold.strip().lower(), action.strip() or "abort"
+        if not sep or metric not in cls.METRICS:
+            raise argparse.ArgumentTypeError(f"无效的 SLO 规则 '{spec}'，指标可选: {', '.join(cls.METRICS)}")
+        if action not in cls.ACTIONS:
+            raise argparse.ArgumentTypeError(f"无效的 SLO 动作 '{action}'，可选: {', '.join(cls.ACTIONS)}")
+        if metric == "tokens" and action == "pause":
+            # tokens 是累计值，暂停后不会回落，规则会一直触发
+            raise argparse.ArgumentTypeError(f"tokens 规则不支持 pause 动作（累计值暂停后不会回落）: '{spec}'")
+
+        scale = 1.0
+        if metric.startswith("p"):
+            # 延迟阈值支持 ms / s 后缀，无后缀按 ms
+            if threshold.endswith("ms"):
+                threshold, scale = threshold[:-2], 0.001
+            elif threshold.endswith("s"):
+                threshold = threshold[:-1]
+            else:
+                scale = 0.001
+        elif threshold.endswith("%"):
+            threshold = threshold[:-1]
+        try:
+            value = float(threshold) * scale
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"无效的 SLO 阈值 '{spec}'")
+        return cls(metric, value, action)
+
+    def describe(self) -> str:
+        if self.metric == "error_rate":
+            return f"error_rate > {self.threshold:g}% ({self.action})"
+        if self.metric == "tokens":
+            return f"tokens > {self.threshold:,.0f} ({self.action})"
+        return f"{self.metric} > {self.threshold*1000:g}ms ({self.action})"
+
+    def format_value(self, value: float) -> str:
+        if self.metric == "error_rate":
+            return f"{value:.1f}%"
+        if self.metric == "tokens":
+            return f"{value:,.0f}"
+        return f"{value*1000:.0f}ms"
+
+    def evaluate(self, window: List[Tuple[float, bool, float]], total_tokens: int, min_samples: int) -> Optional[float]:
+        """返回超过阈值时的指标值，否则返回 None；window 为 (完成时间, 是否成功, 响应时间)"""
+        if self.metric == "tokens":
+            value = float(total_tokens)
+        elif len(window) < min_samples:
+            return None
+        elif self.metric == "error_rate":
+            value = sum(1 for _, success, _ in window if not success) / len(window) * 100
+        else:
+            times = sorted(elapsed for _, success, elapsed in window if success)
+            if not times:
+                return None
+            value = times[min(len(times) - 1, int(len(times) * int(self.metric[1:]) / 100))]
+        return value if value > self.threshold else None
+
+
+class ClaudeLoadTester:
+    # 多轮会话模式下的追问消息池
+    FOLLOW_UP_PROMPTS = [
+        "Please go deeper on the most critical issue you identified and show the corrected code in full.",
+        "What are the trade-offs of your proposal? Compare it with at least two alternative approaches.",
+        "Now write comprehensive unit and integration tests for the solution you described.",
+        "How would this design change if traffic grew by 100x? Walk through the bottlenecks step by step.",
+        "Summarize everything discussed so far as an implementation plan with milestones and risks.",
+        "Identify any mistakes or gaps in your previous answer and correct them.",
     ]
 
-    def __init__(self, endpoint: str, api_key: str, concurrency: int, total_requests: int, model: str = "claude-sonnet-4-5-20250929"):
+    # 响应处理模式: full - 读取完整响应并解析 JSON; usage - 分块读取，仅增量扫描 usage/stop_reason
+    RESPONSE_MODES = ("full", "usage")
+
+    # usage 模式下每次读取的分块大小
+    CHUNK_SIZE = 16 * 1024
+
+    # 用于和网关 / 上游日志关联的请求 ID 响应头，以及服务端报告处理耗时的响应头（按顺序取第一个存在的）
+    REQUEST_ID_HEADERS = ("request-id", "x-request-id")
+    SERVER_TIME_HEADERS = ("server-timing", "x-envoy-upstream-service-time")
+
+    def __init__(self, endpoint: str, api_key: str, concurrency: int, total_requests: int, model: str = "claude-sonnet-4-5-20250929",
+                 response_mode: str = "full", monitor: Optional[SaturationMonitor] = None,
+                 session_turns: int = 0, session_token_budget: int = 0, corpus_path: str = DEFAULT_CORPUS,
+                 trace: Optional[TraceReader] = None, replay_speed: float = 1.0,
+                 guards: Optional[List[SloGuard]] = None, guard_window: float = 60, guard_min_samples: int = 20,
+                 timeouts: Optional[RequestTimeouts] = None, hedge_delay: float = 0, hedge_percentile: int = 0,
+                 hedge_observe_loser: bool = False, transport: str = "aiohttp",
+                 scenarios: Optional[RequestScenarios] = None, slowest: int = 10,
+                 server_time_headers: Optional[List[str]] = None, request_log: Optional[str] = None):
         self.endpoint = endpoint
         self.api_key = api_key
         self.concurrency = concurrency
         self.total_requests = total_requests
         self.model = model
+        self.corpus = PromptCorpus(corpus_path)
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json",
+            "User-Agent": "claude-cli/1.0",
+            "X-App": "cli"
+        }
+        # 单轮请求体的固定前后缀，与语料库中预编码的提示词直接拼接
+        self.payload_prefix = ('{"model": %s, "max_tokens": 2048, "messages": [{"role": "user", "content": ' % json.dumps(model)).encode()
+        self.payload_suffix = b'}]}'
+        self.scenarios = scenarios  # 请求场景混合，None 表示只发送纯文本提示词
+        if scenarios is not None:
+            # 工具 / 图片场景的请求体同样由预编码的片段拼接
+            self.tools_payload_fields = ('{"model": %s, "max_tokens": 2048, "tools": ' % json.dumps(model)).encode() + \
+                scenarios.encoded_tools
+            self.tools_payload_prefix = self.tools_payload_fields + b', "messages": [{"role": "user", "content": '
+            self.image_payload_prefix = self.payload_prefix + b'[' + scenarios.encoded_image_block + b', {"type": "text", "text": '
+            self.image_payload_suffix = b'}]' + self.payload_suffix
+        self.response_mode = response_mode
+        self.monitor = monitor or SaturationMonitor()
+        self.abort_reason = ""  # 非空时停止发送剩余请求
+        self.abort_event = None  # 中止时置位，唤醒等待下一个轨迹时间戳的调度协程（在 run_test 中创建）
+        self.session_turns = session_turns  # 大于 0 时启用多轮会话模式，每个会话最多的轮数
+        self.session_token_budget = session_token_budget  # 会话输入 tokens 达到该值后开始新会话（0 表示不限制）
+        self.trace = trace  # 设置后按轨迹时间戳回放，total_requests 为 0 表示回放整个轨迹
+        self.replay_speed = replay_speed  # 回放速度倍率，10 表示时间压缩为 1/10
+        self.guards = guards or []
+        self.guard_window = guard_window  # SLO 滚动窗口（秒）
+        self.guard_min_samples = guard_min_samples  # 窗口内样本数不足时不评估比例/延迟类规则
+        self.exit_code = EXIT_OK
+        self.timeouts = timeouts or RequestTimeouts()
+        # 对冲请求: 主请求超过固定延迟或已观测延迟的指定百分位仍未完成时，发送一个重复请求，取先成功者
+        self.hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.hedge_observe_loser = hedge_observe_loser  # 不取消落败的主请求，让其跑完以测量未对冲时的真实延迟
+        self.transport = transport  # HTTP 传输后端名称，见 transports.TRANSPORTS
+        self.slowest = slowest  # 延迟归因报告中列出的最慢请求数
+        # 自定义的服务端耗时响应头（毫秒）优先于默认响应头
+        self.server_time_headers = tuple(h.lower() for h in server_time_headers or []) + self.SERVER_TIME_HEADERS
+        self.request_log_path = request_log  # 设置后把每个请求的延迟归因写入 JSONL
+        self.request_log = None
 
         # 统计数据
         self.success_count = 0
@@ -723,104 +623,512 @@ Provide optimized solution with:
         self.response_times = []
         self.total_input_tokens = 0
         self.total_output_tokens = 0
+        self.header_times = []  # 收到响应头的耗时
+        self.response_bytes = []  # 成功响应的响应体大小
+        self.stop_reasons = defaultdict(int)
+        self.turn_times = defaultdict(list)  # 轮次 -> 响应时间
+        self.turn_input_tokens = defaultdict(list)  # 轮次 -> 输入 tokens
+        self.turn_output_tokens = defaultdict(list)  # 轮次 -> 输出 tokens
+        self.sessions_completed = 0
+        self.scenario_results = defaultdict(list)  # 场景 -> [(是否成功, 响应时间, 请求字节数, 输入tokens, 输出tokens)]
+        self.tool_loop_steps = []  # 每个已结束工具循环的请求数
+        self.tool_results_sent = 0
+        self.slowest_requests = []  # 最小堆: (总延迟, 请求编号, 归因记录)，只保留最慢的 slowest 个
+        self.attribution = defaultdict(list)  # 组成 -> 成功且带服务端耗时的请求的各部分耗时
+        self.request_id_count = 0
+        self.server_time_sources = defaultdict(int)  # 响应头 -> 提供服务端耗时的请求数
+        self.replay_drifts = []  # 实际发送时间 - 轨迹计划时间
+        self.replay_waits = []  # 工作协程取出请求的时间 - 轨迹计划时间（等待空闲工作协程）
+        self.replay_duration = 0.0
+        self.replay_span = 0.0  # 已回放部分的轨迹跨度
+        self.streaming_bodies = 0  # 轨迹中 stream: true、已改为非流式发送的请求体数
+        self.recent_results = deque()  # SLO 滚动窗口: (完成时间, 是否成功, 响应时间)
+        self.inflight = set()  # 在途请求任务，cancel 动作时取消
+        self.cancelled_count = 0
+        self.paused_until = 0.0
+        self.pause_backoff = 0.0
+        self.start_time = 0.0
+        self.hedge_records = []  # 每个发出对冲的请求: {"effective", "primary", "winner", "extra_tokens"}
+        self.background_tasks = set()  # 观察模式下仍在运行的落败主请求
+        self._hedge_delay_cache = (0, 0.0)  # (计算时的样本数, 延迟)
         self.lock = asyncio.Lock()
 
-    async def send_request(self, session: aiohttp.ClientSession, request_id: int) -> Tuple[bool, float, str]:
-        """发送单个请求"""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json",
-            "User-Agent": "claude-cli/1.0",
-            "X-App": "cli"
-        }
-
-        # 随机选择一个测试消息
-        message_content = random.choice(self.TEST_MESSAGES)
+    async def read_response(self, response: TransportResponse,
+                            timing: Optional[Dict[str, float]] = None) -> Tuple[int, int, Optional[str], int, Optional[List[Dict]]]:
+        """读取成功响应的响应体，返回 (输入tokens, 输出tokens, stop_reason, 响应字节数, content)
 
-        payload = {
-            "model": self.model,
-            "max_tokens": 2048,  # 增加max_tokens以支持更复杂的回答
-            "messages": [
-                {"role": "user", "content": message_content}
-            ]
-        }
+        usage 模式不解析 content，返回 None；timing 用于累计本次响应的解析耗时
+        """
+        parse_time = 0.0
+        if self.response_mode == "usage":
+            scanner = UsageScanner()
+            while True:
+                chunk = await wait_phase(response.read_chunk(), "idle", self.timeouts.idle)
+                if not chunk:
+                    break
+                t0 = time.perf_counter()
+                scanner.feed(chunk)
+                parse_time += time.perf_counter() - t0
+            self.monitor.json_time += parse_time
+            if timing is not None:
+                timing["parse_time"] = parse_time
+            return scanner.input_tokens, scanner.output_tokens, scanner.stop_reason, scanner.total_bytes, None
+
+        if self.timeouts.idle:
+            chunks = []
+            while True:
+                chunk = await wait_phase(response.read_chunk(), "idle", self.timeouts.idle)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            body = b"".join(chunks)
+        else:
+            body = await response.read()  # 读取完整响应
+        t0 = time.perf_counter()
+        response_data = json.loads(body)
+        parse_time = time.perf_counter() - t0
+        self.monitor.json_time += parse_time
+        if timing is not None:
+            timing["parse_time"] = parse_time
+        usage = response_data.get('usage', {})
+        return (usage.get('input_tokens', 0), usage.get('output_tokens', 0), response_data.get('stop_reason'),
+                len(body), response_data.get('content'))
+
+    def build_request_body(self, conversation: Optional[ConversationSession] = None,
+                           trace_entry: Optional[Dict] = None, scenario: Optional[str] = None) -> bytes:
+        """构建请求体：会话历史、轨迹中的请求体/提示词，或从语料库随机选择（按场景附带工具定义或图片）"""
+        t0 = time.perf_counter()
+        if conversation is not None and scenario == "tool-loop":
+            # 最后一步之前强制调用工具，最后一步由模型决定是否给出最终回答
+            tool_choice = "any" if conversation.turn + 1 < self.scenarios.tool_loop_steps else "auto"
+            rest = json.dumps({"tool_choice": {"type": tool_choice}, "messages": conversation.messages}).encode()
+            data = self.tools_payload_fields + b', ' + rest[1:]
+        elif conversation is not None:
+            payload = {
+                "model": self.model,
+                "max_tokens": 2048,  # 增加max_tokens以支持更复杂的回答
+                "messages": conversation.messages
+            }
+            data = json.dumps(payload).encode()
+        elif trace_entry is not None and "body" in trace_entry:
+            body = trace_entry["body"]
+            if "stream" in body:
+                # 不解析 SSE 流式响应：去掉 stream，按非流式请求发送
+                if body["stream"]:
+                    self.streaming_bodies += 1
+                body = {key: value for key, value in body.items() if key != "stream"}
+            data = json.dumps({"model": self.model, **body}).encode()
+        elif trace_entry is not None and "prompt" in trace_entry:
+            data = self.payload_prefix + json.dumps(trace_entry["prompt"]).encode() + self.payload_suffix
+        elif scenario == "tools":
+            data = self.tools_payload_prefix + self.corpus.encoded(self.corpus.random_index()) + self.payload_suffix
+        elif scenario == "image":
+            data = self.image_payload_prefix + self.corpus.encoded(self.corpus.random_index()) + self.image_payload_suffix
+        else:
+            # 随机选择一个测试消息（语料库中已是 JSON 编码形式，直接拼接）
+            data = self.payload_prefix + self.corpus.encoded(self.corpus.random_index()) + self.payload_suffix
+        self.monitor.json_time += time.perf_counter() - t0
+        return data
+
+    def read_server_info(self, response: TransportResponse) -> Dict[str, Any]:
+        """读取请求 ID 和服务端报告的处理耗时（秒）"""
+        info = {"request_id": None, "server_time": None, "server_time_header": None}
+        for name in self.REQUEST_ID_HEADERS:
+            info["request_id"] = response.header(name)
+            if info["request_id"]:
+                break
+        for name in self.server_time_headers:
+            value = response.header(name)
+            if value:
+                info["server_time"] = parse_server_time(name, value)
+                if info["server_time"] is not None:
+                    info["server_time_header"] = name
+                    break
+        return info
+
+    async def send_request(self, transport: Transport, request_id: int,
+                           scheduled_time: Optional[float] = None,
+                           conversation: Optional[ConversationSession] = None,
+                           trace_entry: Optional[Dict] = None,
+                           data: Optional[bytes] = None,
+                           dispatch_time: Optional[float] = None,
+                           hedge_state: Optional[Dict[str, Any]] = None,
+                           scenario: Optional[str] = None,
+                           record: Optional[Dict[str, Any]] = None) -> Tuple[bool, float, str]:
+        """发送单个请求
+
+        scheduled_time 为计划发送时间（回放模式下为轨迹时间戳）；dispatch_time 为工作协程取出请求的时间，
+        从取出到实际发送的延迟用于检测客户端饱和（不含等待空闲工作协程的时间）；传入 conversation 时发送完整会话历史，
+        成功后把助手回复追加到会话中；传入 trace_entry 时使用轨迹中的请求体或提示词；
+        data 为预先构建的请求体；hedge_state 为同一对冲组共享的状态，只有先成功的一方计入统计；
+        scenario 为请求场景；record 用于回传请求字节数、成功时的 token 数和延迟归因信息
+        （发送延迟、等待工作协程的时间、响应头耗时、解析耗时、请求 ID、服务端耗时）
+        """
+        if data is None:
+            try:
+                data = self.build_request_body(conversation, trace_entry, scenario)
+            except Exception as e:
+                return False, 0.0, f"请求体构建失败: {type(e).__name__}: {str(e)}"
+        if record is not None:
+            record["request_bytes"] = len(data)
 
         start_time = time.time()
+        if dispatch_time is None:
+            dispatch_time = scheduled_time if scheduled_time is not None else start_time
+        if record is not None and scheduled_time is not None:
+            record["send_lag"] = start_time - dispatch_time
+            record["queue_wait"] = dispatch_time - scheduled_time
+        self.monitor.record_send(dispatch_time, start_time)
+        if trace_entry is not None:
+            self.replay_drifts.append(start_time - scheduled_time)
+            self.replay_waits.append(dispatch_time - scheduled_time)
         error_msg = ""
 
         try:
-            async with session.post(
-                self.endpoint,
-                json=payload,
-                headers=headers,
-                timeout=aiohttp.ClientTimeout(total=60)  # 增加超时时间以支持复杂任务
-            ) as response:
-                elapsed = time.time() - start_time
+            response = await wait_phase(
+                transport.post(self.endpoint, data, self.headers, self.timeouts),
+                "first byte", self.timeouts.first_byte
+            )
+            async with response:
+                header_time = time.time() - start_time
+                timing = {"header_time": header_time, "parse_time": 0.0}
+                timing.update(self.read_server_info(response))
 
                 if response.status == 200:
-                    response_data = await response.json()  # 读取完整响应
+                    if hedge_state is not None:
+                        hedge_state["responded"] = hedge_state.get("responded", 0) + 1
+                    input_tokens, output_tokens, stop_reason, body_bytes, content = await self.read_response(response, timing)
+                    # 响应时间包含响应体下载时间
+                    elapsed = time.time() - start_time
+
+                    if hedge_state is not None:
+                        if hedge_state["won"]:
+                            # 对冲组中已有一方先成功：只记录本次的延迟和 token 消耗
+                            hedge_state["loser_elapsed"] = elapsed
+                            hedge_state["loser_tokens"] = input_tokens + output_tokens
+                            return True, elapsed, ""
+                        hedge_state["won"] = True
+                        hedge_state["input_tokens"] = input_tokens
+
+                    if record is not None:
+                        record["input_tokens"] = input_tokens
+                        record["output_tokens"] = output_tokens
+                        record.update(timing)
 
                     # 统计token使用量
-                    if 'usage' in response_data:
-                        usage = response_data['usage']
-                        input_tokens = usage.get('input_tokens', 0)
-                        output_tokens = usage.get('output_tokens', 0)
-                        async with self.lock:
-                            self.total_input_tokens += input_tokens
-                            self.total_output_tokens += output_tokens
+                    async with self.lock:
+                        self.total_input_tokens += input_tokens
+                        self.total_output_tokens += output_tokens
+                        self.header_times.append(header_time)
+                        self.response_bytes.append(body_bytes)
+                        self.stop_reasons[stop_reason or "unknown"] += 1
+
+                        if conversation is not None:
+                            turn = conversation.turn + 1
+                            self.turn_times[turn].append(elapsed)
+                            self.turn_input_tokens[turn].append(input_tokens)
+                            self.turn_output_tokens[turn].append(output_tokens)
+
+                    if conversation is not None:
+                        conversation.add_reply(content, input_tokens)
 
                     return True, elapsed, ""
                 else:
-                    error_text = await response.text()
-                    try:
-                        error_json = json.loads(error_text)
-                        error_msg = f"HTTP {response.status}: {error_json.get('error', {}).get('type', 'unknown')} - {error_json.get('error', {}).get('message', error_text[:100])}"
-                    except:
-                        error_msg = f"HTTP {response.status}: {error_text[:100]}"
-                    return False, elapsed, error_msg
-
-        except asyncio.TimeoutError:
+                    error_text = (await response.read()).decode("utf-8", errors="replace")
+                    elapsed = time.time() - start_time
+                    if record is not None:
+                        record.update(timing)
+                    return False, elapsed, describe_http_error(response.status, error_text)
+
+        except PhaseTimeout as e:
+            elapsed = time.time() - start_time
+            return False, elapsed, f"Timeout: {e}"
+        except asyncio.TimeoutError as e:
             elapsed = time.time() - start_time
-            return False, elapsed, "Timeout (>60s)"
-        except aiohttp.ClientError as e:
+            # 未设置 sock_read，aiohttp 的 ServerTimeoutError 只会来自连接超时
+            if isinstance(e, aiohttp.ServerTimeoutError):
+                return False, elapsed, f"Timeout: connect (>{self.timeouts.connect:g}s)"
+            return False, elapsed, f"Timeout: total (>{self.timeouts.total:g}s)"
+        except (aiohttp.ClientError, TransportError, OSError) as e:
             elapsed = time.time() - start_time
             return False, elapsed, f"ClientError: {str(e)}"
         except Exception as e:
             elapsed = time.time() - start_time
             return False, elapsed, f"Exception: {type(e).__name__}: {str(e)}"
 
-    async def worker(self, session: aiohttp.ClientSession, queue: asyncio.Queue, progress_bar: bool = True):
-        """工作协程"""
+    def connection_limit(self) -> int:
+        """连接池上限：对冲时每个工作协程同时有主请求和对冲请求在途，观察模式下还要容纳跑在后台的落败主请求，
+        否则对冲请求要等主请求释放连接才能发出"""
+        if self.hedge_observe_loser:
+            return self.concurrency * 3
+        if self.hedge_delay or self.hedge_percentile:
+            return self.concurrency * 2
+        return self.concurrency
+
+    def current_hedge_delay(self) -> Optional[float]:
+        """当前的对冲延迟；按百分位时每新增 50 个样本重新计算一次，样本不足 20 个时不对冲"""
+        if not self.hedge_percentile:
+            return self.hedge_delay
+
+        samples, delay = self._hedge_delay_cache
+        if len(self.response_times) < 20:
+            return None
+        if len(self.response_times) - samples >= 50 or not samples:
+            sorted_times = sorted(self.response_times)
+            delay = sorted_times[min(len(sorted_times) - 1, int(len(sorted_times) * self.hedge_percentile / 100))]
+            self._hedge_delay_cache = (len(sorted_times), delay)
+        return delay
+
+    async def send_hedged(self, transport: Transport, request_id: int,
+                          scheduled_time: Optional[float] = None,
+                          conversation: Optional[ConversationSession] = None,
+                          trace_entry: Optional[Dict] = None,
+                          dispatch_time: Optional[float] = None,
+                          scenario: Optional[str] = None,
+                          record: Optional[Dict[str, Any]] = None) -> Tuple[bool, float, str]:
+        """对冲发送：主请求超过对冲延迟仍未完成时发送重复请求，取先成功的一方并取消另一方
+
+        返回的响应时间从主请求发出时算起
+        """
+        try:
+            data = self.build_request_body(conversation, trace_entry, scenario)
+        except Exception as e:
+            return False, 0.0, f"请求体构建失败: {type(e).__name__}: {str(e)}"
+        state = {"won": False}
+        start = time.time()
+        primary = asyncio.ensure_future(self.send_request(transport, request_id, scheduled_time=scheduled_time,
+                                                          conversation=conversation, trace_entry=trace_entry,
+                                                          data=data, dispatch_time=dispatch_time,
+                                                          hedge_state=state, record=record))
+        hedge = None
+        try:
+            delay = self.current_hedge_delay()
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            hedge = asyncio.ensure_future(self.send_request(transport, request_id, conversation=conversation,
+                                                            data=data, hedge_state=state, record=record))
+            pending = {primary, hedge}
+            failure = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    success, _, error_msg = task.result()
+                    if success and state["won"]:
+                        effective = time.time() - start
+                        self.record_hedge(state, primary, hedge, winner="primary" if task is primary else "hedge",
+                                          effective=effective)
+                        return True, effective, ""
+                    failure = failure or (success, 0.0, error_msg)
+
+            effective = time.time() - start
+            self.record_hedge(state, primary, hedge, winner=None, effective=effective)
+            return False, effective, failure[2]
+        finally:
+            for task in (primary, hedge):
+                if task is None or task.done():
+                    continue
+                if task is primary and self.hedge_observe_loser and not self.abort_reason:
+                    # 观察模式：让落败的主请求跑完，以测量未对冲时的真实延迟
+                    self.background_tasks.add(task)
+                    self.inflight.add(task)
+                    task.add_done_callback(self.background_tasks.discard)
+                    task.add_done_callback(self.inflight.discard)
+                else:
+                    task.cancel()
+
+    def record_hedge(self, state: Dict[str, Any], primary: asyncio.Future, hedge: asyncio.Future,
+                     winner: Optional[str], effective: float):
+        """记录一次发出了对冲的请求；主请求未完成时其延迟在观察模式下由回调补齐"""
+        record = {"effective": effective, "primary": None, "winner": winner, "extra_tokens": 0, "estimated": False,
+                  "unknown": False}
+        if winner == "primary":
+            record["primary"] = effective
+        if primary.done() and not primary.cancelled():
+            record["primary"] = primary.result()[1]
+
+        def on_loser_done(_):
+            # 落败方跑完时记录其真实消耗；主请求落败时同时得到未对冲的真实延迟
+            if "loser_tokens" in state:
+                record["extra_tokens"] = state["loser_tokens"]
+                record["estimated"] = False
+            if not loser.cancelled():
+                record["unknown"] = False
+            if winner == "hedge" and not primary.cancelled():
+                record["primary"] = primary.result()[1]
+
+        loser = hedge if winner == "primary" else primary
+        if winner is not None:
+            if state.get("responded", 0) >= 2:
+                # 落败方已收到 200 响应头（服务端已处理完提示词），被取消时按胜出方的输入 tokens 估算
+                record["extra_tokens"] = state.get("input_tokens", 0)
+                record["estimated"] = True
+            else:
+                # 落败方未收到响应头（可能还在等待连接或服务端处理），消耗未知，不计入估算
+                record["unknown"] = True
+            if loser.done():
+                on_loser_done(loser)
+            else:
+                loser.add_done_callback(on_loser_done)
+        self.hedge_records.append(record)
+
+    async def worker(self, transport: Transport, queue: asyncio.Queue, progress_bar: bool = True):
+        """工作协程（多轮会话模式下每个工作协程就是一个虚拟用户）"""
+        conversation = None
+        scenario = None
+
         while True:
             try:
-                request_id = await asyncio.wait_for(queue.get(), timeout=0.1)
+                item = await asyncio.wait_for(queue.get(), timeout=0.1)
             except asyncio.TimeoutError:
                 continue
             except:
                 break
 
-            if request_id is None:
+            if item is None:
                 queue.task_done()
                 break
 
-            success, elapsed, error_msg = await self.send_request(session, request_id)
+            # 队列元素: (请求编号, 计划发送时间, 轨迹条目)，非回放模式下后两项为 None
+            request_id, scheduled_time, trace_entry = item
+
+            # 测试已中止：直接丢弃剩余请求，让 queue.join() 尽快返回
+            if self.abort_reason:
+                queue.task_done()
+                continue
+
+            # 客户端饱和或 SLO 守护暂停时停止发送，直到恢复
+            while not self.abort_reason and (time.time() < self.paused_until
+                                             or (self.monitor.saturated and self.monitor.action == "throttle")):
+                await asyncio.sleep(self.monitor.interval)
+
+            if self.abort_reason:
+                queue.task_done()
+                continue
+
+            if conversation is None:
+                # 工具循环在整个循环内保持同一场景，其它场景每个请求重新选择
+                scenario = self.scenarios.choose() if self.scenarios is not None else None
+                if self.session_turns > 0 or scenario == "tool-loop":
+                    conversation = ConversationSession(self.corpus.text(self.corpus.random_index()))
+
+            record = {}
+            dispatch_time = time.time()
+            send = self.send_hedged if (self.hedge_delay or self.hedge_percentile) else self.send_request
+            task = asyncio.ensure_future(send(transport, request_id,
+                                              scheduled_time=scheduled_time or dispatch_time,
+                                              conversation=conversation, trace_entry=trace_entry,
+                                              dispatch_time=dispatch_time, scenario=scenario, record=record))
+            self.inflight.add(task)
+            try:
+                success, elapsed, error_msg = await task
+            except asyncio.CancelledError:
+                # 被 SLO 守护取消的在途请求不计入成功/失败统计
+                if not task.cancelled():
+                    raise
+                self.cancelled_count += 1
+                queue.task_done()
+                continue
+            finally:
+                self.inflight.discard(task)
+
+            if conversation is not None and scenario == "tool-loop":
+                # 模型调用了工具且未达到步数上限时回填合成的 tool_result，否则结束循环
+                tool_results = 0
+                if success and conversation.turn < self.scenarios.tool_loop_steps:
+                    tool_results = conversation.add_tool_results(self.scenarios.tool_result_text)
+                self.tool_results_sent += tool_results
+                if not tool_results:
+                    self.tool_loop_steps.append(conversation.turn + (0 if success else 1))
+                    conversation = None
+            elif conversation is not None:
+                # 失败、达到轮数或超出 token 预算时结束当前会话，下一个请求开始新会话
+                if (not success or conversation.turn >= self.session_turns
+                        or (self.session_token_budget and conversation.last_input_tokens >= self.session_token_budget)):
+                    conversation = None
+                    self.sessions_completed += 1
+                else:
+                    conversation.add_follow_up(random.choice(self.FOLLOW_UP_PROMPTS))
 
             async with self.lock:
                 self.response_times.append(elapsed)
+                self.record_attribution(request_id, success, elapsed, error_msg, record)
+                if scenario is not None:
+                    self.scenario_results[scenario].append((success, elapsed, record.get("request_bytes", 0),
+                                                            record.get("input_tokens", 0), record.get("output_tokens", 0)))
+                if self.guards:
+                    self.recent_results.append((time.time(), success, elapsed))
 
                 if success:
                     self.success_count += 1
-                    if progress_bar:
-                        print(f"\r进度: {self.success_count + self.failure_count}/{self.total_requests} | 成功: {self.success_count} | 失败: {self.failure_count}", end="", flush=True)
                 else:
                     self.failure_count += 1
                     self.error_types[error_msg] += 1
-                    if progress_bar:
-                        print(f"\r进度: {self.success_count + self.failure_count}/{self.total_requests} | 成功: {self.success_count} | 失败: {self.failure_count}", end="", flush=True)
+
+                if progress_bar:
+                    t0 = time.perf_counter()
+                    print(f"\r进度: {self.success_count + self.failure_count}/{self.total_requests or '?'} | 成功: {self.success_count} | 失败: {self.failure_count}", end="", flush=True)
+                    self.monitor.print_time += time.perf_counter() - t0
 
             queue.task_done()
 
+    def record_attribution(self, request_id: int, success: bool, elapsed: float, error_msg: str, record: Dict[str, Any]):
+        """把一个请求的延迟拆分为客户端开销、等待工作协程、网络/排队和服务端处理，更新最慢请求列表并写入请求日志
+
+        客户端开销 = 发送延迟（工作协程取出请求到实际发送，含请求体构建）+ 响应解析；
+        等待工作协程为回放模式下轨迹计划时间到被工作协程取出的时间（在途请求占满工作协程时排队）；
+        服务端处理取响应头报告的耗时；网络/排队为响应时间中剩余的部分（连接池等待、传输、网关排队、下载）
+        """
+        queue_wait = record.get("queue_wait", 0.0)
+        send_lag = record.get("send_lag", 0.0)
+        parse_time = record.get("parse_time", 0.0)
+        server_time = record.get("server_time")
+        if server_time is not None and "header_time" in record:
+            # 服务端耗时不会超过收到响应头的耗时（响应头精度为毫秒）
+            server_time = min(server_time, record["header_time"])
+        client = send_lag + parse_time
+        network = elapsed - parse_time - (server_time or 0.0)
+        total = queue_wait + send_lag + elapsed
+        entry = {
+            "request": request_id,
+            "success": success,
+            "error": error_msg or None,
+            "total": total,
+            "client": client,
+            "queue": queue_wait,
+            "network": network,
+            "server": server_time,
+            "request_id": record.get("request_id"),
+            "server_time_header": record.get("server_time_header"),
+        }
+
+        if entry["request_id"]:
+            self.request_id_count += 1
+        if server_time is not None:
+            self.server_time_sources[entry["server_time_header"]] += 1
+            if success:
+                self.attribution["client"].append(client)
+                self.attribution["queue"].append(queue_wait)
+                self.attribution["network"].append(network)
+                self.attribution["server"].append(server_time)
+
+        if self.slowest:
+            if len(self.slowest_requests) < self.slowest:
+                heapq.heappush(self.slowest_requests, (total, request_id, entry))
+            elif total > self.slowest_requests[0][0]:
+                heapq.heapreplace(self.slowest_requests, (total, request_id, entry))
+
+        if self.request_log is not None:
+            t0 = time.perf_counter()
+            self.request_log.write(json.dumps({
+                **entry,
+                "timestamp": round(time.time(), 3),
+                **{key: round(entry[key] * 1000, 3) if entry[key] is not None else None
+                   for key in ("total", "client", "queue", "network", "server")},
+            }) + "\n")
+            self.monitor.json_time += time.perf_counter() - t0
+
     async def run_test(self):
         """运行负载测试"""
         print(f"\n{'='*60}")
@@ -828,43 +1136,360 @@ Provide optimized solution with:
         print(f"{'='*60}")
         print(f"端点: {self.endpoint}")
         print(f"模型: {self.model}")
+        print(f"响应处理: {self.response_mode}")
+        print(f"传输后端: {self.transport} (事件循环: {type(asyncio.get_running_loop()).__module__.split('.')[0]})")
         print(f"并发数: {self.concurrency}")
-        print(f"总请求数: {self.total_requests}")
-        print(f"测试样本: {len(self.TEST_MESSAGES)} 种不同复杂度的消息（随机选择）")
+        print(f"总请求数: {self.total_requests or '轨迹全部请求'}")
+        if self.trace is not None:
+            print(f"轨迹回放: {self.trace.path} (速度 {self.replay_speed:g}x)")
+        t = self.timeouts
+        limits = [f"{name} {f'{value}s' if value else '不限'}" for name, value in
+                  (("总计", t.total), ("连接", t.connect), ("首字节", t.first_byte), ("分块间隔", t.idle))]
+        print(f"超时: {' / '.join(limits)}")
+        if self.hedge_delay or self.hedge_percentile:
+            print(f"对冲请求: {self.describe_hedge_delay()}后发送重复请求"
+                  f"{'（观察落败主请求）' if self.hedge_observe_loser else ''}")
+        print(f"测试样本: {len(self.corpus)} 种不同复杂度的消息（随机选择，语料库: {self.corpus.path}）")
+        if self.scenarios is not None:
+            sc = self.scenarios
+            print(f"请求场景: {sc.describe()}（{sc.tool_count} 个工具定义 {len(sc.encoded_tools) / 1024:.1f}KB，"
+                  f"图片 {sc.image_size / 1024:.0f}KB，工具循环最多 {sc.tool_loop_steps} 步）")
+        if self.session_turns > 0:
+            budget = f"{self.session_token_budget:,} 输入 tokens" if self.session_token_budget else "不限"
+            print(f"多轮会话: 每个会话最多 {self.session_turns} 轮，token 预算 {budget}")
         print(f"开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"{'='*60}\n")
 
-        # 创建队列
-        queue = asyncio.Queue()
-        for i in range(self.total_requests):
-            await queue.put(i)
+        self.abort_event = asyncio.Event()
 
-        # 添加结束标记
-        for _ in range(self.concurrency):
-            await queue.put(None)
+        # 创建队列（回放模式下由调度协程按时间流式放入，队列有界以保持内存恒定）
+        if self.trace is not None:
+            queue = asyncio.Queue(maxsize=self.concurrency)
+        else:
+            queue = asyncio.Queue()
+            for i in range(self.total_requests):
+                await queue.put((i, None, None))
 
-        # 创建会话和工作协程
-        connector = aiohttp.TCPConnector(limit=self.concurrency)
-        async with aiohttp.ClientSession(connector=connector) as session:
+            # 添加结束标记
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        if self.request_log_path:
+            self.request_log = open(self.request_log_path, "w", encoding="utf-8")
+
+        # 创建传输后端和工作协程
+        async with create_transport(self.transport, self.connection_limit()) as transport:
             start_time = time.time()
+            self.start_time = start_time
+            monitor_task = asyncio.create_task(self.monitor.run(self.on_saturated))
+            guard_task = asyncio.create_task(self.run_guards()) if self.guards else None
 
             workers = [
-                asyncio.create_task(self.worker(session, queue))
+                asyncio.create_task(self.worker(transport, queue))
                 for _ in range(self.concurrency)
             ]
 
+            # 回放模式下先等调度协程放完所有请求，否则轨迹间隙中队列为空时 join 会提前返回
+            if self.trace is not None:
+                await self.replay_producer(queue)
+
             # 等待所有任务完成
             await queue.join()
 
+            # 观察模式下等待落败的主请求跑完，再关闭连接
+            if self.background_tasks:
+                await asyncio.gather(*self.background_tasks, return_exceptions=True)
+
             # 取消工作协程
             for w in workers:
                 w.cancel()
+            monitor_task.cancel()
+            if guard_task is not None:
+                guard_task.cancel()
 
             total_time = time.time() - start_time
 
+        if self.request_log is not None:
+            self.request_log.close()
+
         # 打印统计结果
         self.print_stats(total_time)
 
+    async def replay_producer(self, queue: asyncio.Queue):
+        """按轨迹时间戳（除以速度倍率）把请求放入队列；队列满时的等待会体现为调度偏差"""
+        start = time.time()
+        for request_id, (offset, entry) in enumerate(self.trace):
+            if self.abort_reason or (self.total_requests and request_id >= self.total_requests):
+                break
+
+            target = start + offset / self.replay_speed
+            delay = target - time.time()
+            if delay > 0:
+                # 轨迹间隙可能很长：中止时立即停止等待，而不是等到下一个时间戳
+                try:
+                    await asyncio.wait_for(self.abort_event.wait(), delay)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+            if self.abort_reason:
+                break
+            await queue.put((request_id, target, entry))
+            self.replay_span = offset
+
+        self.replay_duration = time.time() - start
+
+        # 添加结束标记
+        for _ in range(self.concurrency):
+            await queue.put(None)
+
+    def abort(self, reason: str, exit_code: int):
+        """停止发送剩余请求（只记录第一次中止的原因）"""
+        if self.abort_reason:
+            return
+        self.abort_reason = reason
+        self.exit_code = exit_code
+        if self.abort_event is not None:
+            self.abort_event.set()
+
+    def on_saturated(self, reason: str):
+        """客户端饱和回调：abort 模式下停止发送剩余请求"""
+        if self.monitor.action == "abort":
+            self.abort(f"客户端饱和: {reason}", EXIT_CLIENT_SATURATED)
+
+    async def run_guards(self, interval: float = 1.0):
+        """周期性评估 SLO 守护规则"""
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            while self.recent_results and self.recent_results[0][0] < now - self.guard_window:
+                self.recent_results.popleft()
+
+            window = list(self.recent_results)
+            total_tokens = self.total_input_tokens + self.total_output_tokens
+            for guard in self.guards:
+                if guard.action == "pause" and now < self.paused_until:
+                    # 暂停期间不重复触发，避免不断推迟恢复时间
+                    continue
+                value = guard.evaluate(window, total_tokens, self.guard_min_samples)
+                if value is not None:
+                    self.fire_guard(guard, value, now)
+
+    def fire_guard(self, guard: SloGuard, value: float, now: float):
+        """执行守护规则的动作"""
+        guard.fired_count += 1
+        if guard.first_fired_at is None:
+            guard.first_fired_at = now - self.start_time
+            guard.fired_value = value
+
+        if guard.action == "pause":
+            # 暂停发送并指数退避；清空窗口，恢复后基于新样本重新评估
+            self.pause_backoff = min(self.pause_backoff * 2, 60.0) if self.pause_backoff else 5.0
+            self.paused_until = now + self.pause_backoff
+            self.recent_results.clear()
+            print(f"\n⚠️  SLO 守护触发: {guard.describe()}，当前 {guard.format_value(value)}，暂停 {self.pause_backoff:.0f}s")
+            if self.exit_code == EXIT_OK:
+                self.exit_code = EXIT_SLO_VIOLATED
+            return
+
+        self.abort(f"SLO 守护触发: {guard.describe()}，当前 {guard.format_value(value)}", EXIT_SLO_ABORTED)
+        if guard.action == "cancel":
+            for task in list(self.inflight):
+                task.cancel()
+
+    @staticmethod
+    def print_time_stats(title: str, times: List[float]):
+        """打印一组耗时的分布（秒 -> 毫秒）"""
+        sorted_times = sorted(times)
+        print(f"\n{title}:")
+        print(f"  最小值: {sorted_times[0]*1000:.2f}ms")
+        print(f"  最大值: {sorted_times[-1]*1000:.2f}ms")
+        print(f"  平均值: {sum(sorted_times)/len(sorted_times)*1000:.2f}ms")
+        print(f"  P50: {sorted_times[len(sorted_times)//2]*1000:.2f}ms")
+        print(f"  P90: {sorted_times[int(len(sorted_times)*0.9)]*1000:.2f}ms")
+        print(f"  P95: {sorted_times[int(len(sorted_times)*0.95)]*1000:.2f}ms")
+        print(f"  P99: {sorted_times[int(len(sorted_times)*0.99)]*1000:.2f}ms")
+
+    def print_turn_stats(self):
+        """按轮次打印多轮会话（或工具循环每一步）的延迟、输入 tokens 和输出吞吐，体现上下文增长的影响"""
+        if self.scenarios is not None:
+            print(f"\n工具循环统计（按步骤，共 {len(self.tool_loop_steps)} 个已结束循环）:")
+        else:
+            print(f"\n多轮会话统计（按轮次，共 {self.sessions_completed} 个已结束会话）:")
+        print(f"  轮次     请求数     平均延迟    P95延迟     平均输入         输出吞吐")
+        for turn in sorted(self.turn_times):
+            times = sorted(self.turn_times[turn])
+            avg_input = sum(self.turn_input_tokens[turn]) / len(times)
+            throughput = sum(self.turn_output_tokens[turn]) / sum(times) if sum(times) > 0 else 0
+            print(f"  {turn:<6} {len(times):>8} {sum(times)/len(times)*1000:>10.0f}ms {times[int(len(times)*0.95)]*1000:>8.0f}ms "
+                  f"{avg_input:>12,.0f} {throughput:>10.1f} tok/s")
+
+    def print_scenario_stats(self):
+        """按请求场景打印请求体大小、延迟和 token 消耗，用于按 agent 类负载评估网关容量"""
+        print(f"\n请求场景统计:")
+        print(f"  场景         请求数   成功率   平均请求体   最大请求体    平均延迟    P95延迟   平均输入   平均输出")
+        for name in self.scenarios.NAMES:
+            results = self.scenario_results.get(name)
+            if not results:
+                continue
+            succeeded = [r for r in results if r[0]]
+            sizes = [r[2] for r in results]
+            times = sorted(r[1] for r in results)
+            avg_input = sum(r[3] for r in succeeded) / len(succeeded) if succeeded else 0
+            avg_output = sum(r[4] for r in succeeded) / len(succeeded) if succeeded else 0
+            print(f"  {name:<10} {len(results):>8} {len(succeeded) / len(results) * 100:>7.1f}% "
+                  f"{sum(sizes) / len(sizes) / 1024:>10.1f}KB {max(sizes) / 1024:>10.1f}KB "
+                  f"{sum(times) / len(times) * 1000:>9.0f}ms {times[int(len(times) * 0.95)] * 1000:>8.0f}ms "
+                  f"{avg_input:>10,.0f} {avg_output:>10,.0f}")
+
+        if self.tool_loop_steps:
+            steps = self.tool_loop_steps
+            print(f"  工具循环: {len(steps)} 个已结束，平均 {sum(steps) / len(steps):.1f} 步 / 最多 {max(steps)} 步，"
+                  f"回填 tool_result {self.tool_results_sent} 个")
+            if self.tool_results_sent == 0:
+                print(f"  ⚠️  服务端未返回任何 tool_use，工具循环只发送了第一步")
+
+    def print_attribution_stats(self):
+        """打印延迟归因：各组成部分的分布，以及最慢请求的拆分和请求 ID，便于与网关 / 上游日志对照"""
+        total = self.success_count + self.failure_count
+        print(f"\n延迟归因:")
+        print(f"  带 request-id 的请求: {self.request_id_count}/{total}")
+        sources = ", ".join(f"{name} {count}" for name, count in self.server_time_sources.items())
+        print(f"  带服务端耗时的请求: {sum(self.server_time_sources.values())}/{total}"
+              f"{f' ({sources})' if sources else ''}")
+
+        # 等待工作协程只在回放模式下出现（其它模式下请求取出即发送）
+        components = [("client", "客户端开销  "), ("network", "网络/排队   "), ("server", "服务端处理  ")]
+        replay = self.trace is not None
+        if replay:
+            components.insert(1, ("queue", "等待工作协程"))
+        if self.attribution:
+            mean_total = sum(sum(self.attribution[k]) for k, _ in components)
+            print(f"\n  按组成统计（{len(self.attribution['server'])} 个带服务端耗时的成功请求）:")
+            print(f"  组成              平均       P50       P95       P99    占比")
+            for key, label in components:
+                values = sorted(self.attribution[key])
+                share = sum(values) / mean_total * 100 if mean_total > 0 else 0
+                print(f"  {label}{sum(values) / len(values) * 1000:>8.2f}ms "
+                      f"{values[len(values) // 2] * 1000:>7.2f}ms {values[int(len(values) * 0.95)] * 1000:>7.2f}ms "
+                      f"{values[int(len(values) * 0.99)] * 1000:>7.2f}ms {share:>6.1f}%")
+
+        if self.slowest_requests:
+            slowest = sorted(self.slowest_requests, reverse=True)
+            if replay:
+                print(f"\n最慢的 {len(slowest)} 个请求（总延迟 = 等待工作协程 + 发送延迟 + 响应时间）:")
+                print(f"       总延迟     客户端 等待工作协程   网络/排队     服务端  request-id                      结果")
+            else:
+                print(f"\n最慢的 {len(slowest)} 个请求（总延迟 = 发送延迟 + 响应时间）:")
+                print(f"       总延迟     客户端   网络/排队     服务端  request-id                      结果")
+            missing_server_time = False
+            for total_time, _, entry in slowest:
+                if entry["server"] is None:
+                    missing_server_time = True
+                    server = "-"
+                    network = f"{entry['network'] * 1000:.1f}ms*"
+                else:
+                    server = f"{entry['server'] * 1000:.1f}ms"
+                    network = f"{entry['network'] * 1000:.1f}ms"
+                result = "OK" if entry["success"] else (entry["error"] or "")[:60]
+                queue = f" {entry['queue'] * 1000:>10.1f}ms" if replay else ""
+                print(f"  {total_time * 1000:>9.1f}ms {entry['client'] * 1000:>8.1f}ms{queue} {network:>11} {server:>10}  "
+                      f"{entry['request_id'] or '-':<30}  {result}")
+            if missing_server_time:
+                print(f"  * 响应未报告服务端耗时，网络/排队包含服务端处理时间")
+        if self.request_log_path:
+            print(f"  每个请求的延迟归因已写入 {self.request_log_path}")
+
+    def print_replay_stats(self):
+        """打印轨迹回放的调度偏差（实际发送时间相对轨迹计划时间的滞后）"""
+        print(f"\n轨迹回放统计:")
+        print(f"  速度倍率: {self.replay_speed:g}x")
+        print(f"  回放请求数: {len(self.replay_drifts)}")
+        if self.trace.skipped:
+            print(f"  跳过无法解析的行: {self.trace.skipped}")
+        if self.streaming_bodies:
+            print(f"  流式请求: {self.streaming_bodies} 个请求体带 stream: true，已改为非流式发送")
+        print(f"  轨迹跨度: {self.replay_span:.2f}s (按倍率应为 {self.replay_span / self.replay_speed:.2f}s)")
+        print(f"  实际调度耗时: {self.replay_duration:.2f}s")
+        if self.replay_drifts:
+            drifts = sorted(self.replay_drifts)
+            late = sum(1 for d in drifts if d > self.monitor.max_send_lag)
+            print(f"  调度偏差: P50 {drifts[len(drifts)//2]*1000:.2f}ms / P95 {drifts[int(len(drifts)*0.95)]*1000:.2f}ms / "
+                  f"P99 {drifts[int(len(drifts)*0.99)]*1000:.2f}ms / 最大 {drifts[-1]*1000:.2f}ms")
+            print(f"  偏差超过 {self.monitor.max_send_lag*1000:.0f}ms 的请求: {late}/{len(drifts)} ({late/len(drifts)*100:.1f}%)")
+            waits = sorted(self.replay_waits)
+            print(f"  其中等待空闲工作协程: P50 {waits[len(waits)//2]*1000:.2f}ms / P95 {waits[int(len(waits)*0.95)]*1000:.2f}ms / "
+                  f"最大 {waits[-1]*1000:.2f}ms")
+            if late and waits[int(len(waits)*0.95)] > self.monitor.max_send_lag:
+                print(f"  ⚠️  工作协程池不足：在途请求占满了 {self.concurrency} 个工作协程，轨迹请求排队等待，"
+                      f"实际到达速率低于轨迹（与客户端 CPU 饱和无关），可提高 -c 或降低 --replay-speed")
+
+    def describe_hedge_delay(self) -> str:
+        if self.hedge_percentile:
+            return f"超过已观测延迟 P{self.hedge_percentile} "
+        return f"超过 {self.hedge_delay*1000:.0f}ms "
+
+    def print_hedge_stats(self):
+        """打印对冲请求的额外负载、额外 tokens 以及对尾延迟的改善"""
+        records = self.hedge_records
+        total = len(self.response_times)
+        print(f"\n对冲请求统计 ({self.describe_hedge_delay().strip()}):")
+        print(f"  发出对冲: {len(records)}/{total} ({len(records)/total*100 if total else 0:.1f}% 额外请求)")
+        print(f"  对冲胜出: {sum(1 for r in records if r['winner'] == 'hedge')} 次，"
+              f"主请求胜出: {sum(1 for r in records if r['winner'] == 'primary')} 次，"
+              f"均失败: {sum(1 for r in records if r['winner'] is None)} 次")
+
+        measured = sum(r["extra_tokens"] for r in records if not r["estimated"])
+        estimated = sum(r["extra_tokens"] for r in records if r["estimated"])
+        total_tokens = self.total_input_tokens + self.total_output_tokens
+        print(f"  额外 tokens: 实测 {measured:,} + 估算 {estimated:,}"
+              f"{f' (占总 tokens {(measured + estimated) / total_tokens * 100:.1f}%)' if total_tokens else ''}")
+        if estimated:
+            print(f"    (已收到响应头后被取消的一方，按胜出方的输入 tokens 估算)")
+        unknown = sum(1 for r in records if r["unknown"])
+        if unknown:
+            print(f"    另有 {unknown} 个重复请求在收到响应头前被取消，消耗未知，未计入")
+
+        if not records or not total:
+            return
+
+        # 未对冲的延迟分布: 把发出对冲的请求替换为主请求自身的延迟（未知时取对冲后延迟作为下界）
+        hedged = defaultdict(int)
+        for r in records:
+            hedged[r["effective"]] += 1
+        unhedged = []
+        for t in self.response_times:
+            if hedged[t]:
+                hedged[t] -= 1
+            else:
+                unhedged.append(t)
+        unknown = 0
+        for r in records:
+            if r["primary"] is None:
+                unknown += 1
+            unhedged.append(r["primary"] if r["primary"] is not None else r["effective"])
+
+        with_hedge = sorted(self.response_times)
+        unhedged.sort()
+        print(f"  尾延迟对比（未对冲 → 对冲后）:")
+        for name, q in (("P50", 0.5), ("P95", 0.95), ("P99", 0.99)):
+            before = unhedged[min(len(unhedged) - 1, int(len(unhedged) * q))]
+            after = with_hedge[min(len(with_hedge) - 1, int(len(with_hedge) * q))]
+            print(f"    {name}: {before*1000:.0f}ms → {after*1000:.0f}ms ({(after - before) / before * 100 if before else 0:+.1f}%)")
+        if unknown:
+            print(f"    其中 {unknown} 个主请求被取消，未对冲延迟取下界；使用 --hedge-observe-loser 测量真实值")
+
+    def print_guard_stats(self):
+        """打印 SLO 守护规则及触发情况"""
+        print(f"\nSLO 守护 (窗口 {self.guard_window:g}s):")
+        for guard in self.guards:
+            if guard.fired_count:
+                print(f"  ✗ {guard.describe()} - 第 {guard.first_fired_at:.1f}s 首次触发 "
+                      f"(当时 {guard.format_value(guard.fired_value)})，共触发 {guard.fired_count} 次")
+            else:
+                print(f"  ✓ {guard.describe()}")
+        if self.cancelled_count:
+            print(f"  已取消在途请求: {self.cancelled_count}")
+
     def print_stats(self, total_time: float):
         """打印统计结果"""
         print(f"\n\n{'='*60}")
@@ -894,15 +1519,22 @@ Provide optimized solution with:
             print(f"  总计 Tokens: {total_tokens:,}")
 
         if self.response_times:
-            sorted_times = sorted(self.response_times)
-            print(f"\n响应时间统计:")
-            print(f"  最小值: {min(self.response_times)*1000:.2f}ms")
-            print(f"  最大值: {max(self.response_times)*1000:.2f}ms")
-            print(f"  平均值: {sum(self.response_times)/len(self.response_times)*1000:.2f}ms")
-            print(f"  P50: {sorted_times[len(sorted_times)//2]*1000:.2f}ms")
-            print(f"  P90: {sorted_times[int(len(sorted_times)*0.9)]*1000:.2f}ms")
-            print(f"  P95: {sorted_times[int(len(sorted_times)*0.95)]*1000:.2f}ms")
-            print(f"  P99: {sorted_times[int(len(sorted_times)*0.99)]*1000:.2f}ms")
+            self.print_time_stats("响应时间统计（含响应体下载）", self.response_times)
+
+        if self.header_times:
+            self.print_time_stats("响应头时间统计", self.header_times)
+
+        if self.response_bytes:
+            total_bytes = sum(self.response_bytes)
+            print(f"\n响应体统计:")
+            print(f"  总字节数: {total_bytes:,}")
+            print(f"  平均大小: {total_bytes / len(self.response_bytes):,.0f} bytes/请求")
+            print(f"  最大值: {max(self.response_bytes):,} bytes")
+
+        if self.stop_reasons:
+            print(f"\nstop_reason 分布:")
+            for reason, count in sorted(self.stop_reasons.items(), key=lambda x: x[1], reverse=True):
+                print(f"  {reason}: {count}")
 
         if self.error_types:
             print(f"\n错误类型分布:")
@@ -911,6 +1543,414 @@ Provide optimized solution with:
                 percentage = (count / self.failure_count * 100) if self.failure_count > 0 else 0
                 print(f"  [{count}次, {percentage:.1f}%] {error_msg}")
 
+        if total and (self.slowest or self.request_log_path):
+            self.print_attribution_stats()
+
+        if self.scenario_results:
+            self.print_scenario_stats()
+
+        if self.turn_times:
+            self.print_turn_stats()
+
+        if self.trace is not None:
+            self.print_replay_stats()
+
+        if self.hedge_delay or self.hedge_percentile:
+            self.print_hedge_stats()
+
+        if self.guards:
+            self.print_guard_stats()
+
+        self.monitor.print_stats()
+
+        if self.abort_reason:
+            print(f"\n测试已提前中止: {self.abort_reason}")
+            if self.total_requests:
+                print(f"  未发送请求数: {self.total_requests - total - self.cancelled_count}")
+
+        print(f"\n{'='*60}\n")
+
+
+class BatchTester:
+    """Message Batches API 吞吐测试：构建批次、提交、带退避轮询状态、流式读取结果文件
+
+    请求体复用 ClaudeLoadTester 的构建逻辑（语料库随机选择，或 JSONL 中的 prompt / body），
+    同时处理中的批次数受 tester.concurrency 限制，只有处理中的批次会占用内存
+    """
+
+    def __init__(self, tester: ClaudeLoadTester, batch_size: int, source: Optional[str] = None,
+                 poll_interval: float = 5.0, poll_max_interval: float = 60.0, poll_retries: int = 5):
+        self.tester = tester
+        self.batch_size = batch_size
+        self.source = source  # JSONL，每行 {"custom_id"?, "prompt" | "body"}；为空时从语料库随机选择
+        self.reader = BatchSource(source) if source else None
+        self.poll_interval = poll_interval
+        self.poll_max_interval = poll_max_interval
+        self.poll_retries = poll_retries  # 连续轮询失败达到该次数后放弃批次
+        self.batches_url = tester.endpoint.rstrip("/") + "/batches"
+
+        # 统计数据
+        self.batch_stats = []  # 每个批次: {"id", "items", "bytes", "submit", "completion", "download", "polls"}
+        self.failed_batches = defaultdict(int)  # 错误描述 -> 次数
+        self.poll_errors = defaultdict(int)  # 单次轮询失败（已重试），错误描述 -> 次数
+        self.result_types = defaultdict(int)  # succeeded / errored / canceled / expired
+        self.item_errors = defaultdict(int)
+        self.total_input_tokens = 0
+        self.total_output_tokens = 0
+
+    def iter_requests(self) -> Iterator[Tuple[str, bytes]]:
+        """产出 (custom_id, 请求参数 JSON)，总数为 tester.total_requests（来自文件时最多为有效行数）"""
+        if self.reader is None:
+            for i in range(self.tester.total_requests):
+                yield f"req-{i}", self.tester.build_request_body()
+            return
+
+        for custom_id, entry in itertools.islice(self.reader, self.tester.total_requests or None):
+            yield custom_id, self.tester.build_request_body(trace_entry=entry)
+
+    def next_batch_body(self, requests: Iterator[Tuple[str, bytes]]) -> Tuple[int, bytes]:
+        """从请求流中取出下一批，直接拼接为请求体，返回 (条数, 请求体)"""
+        items = [b'{"custom_id": %s, "params": %s}' % (json.dumps(custom_id).encode(), params)
+                 for custom_id, params in itertools.islice(requests, self.batch_size)]
+        return len(items), b'{"requests": [' + b", ".join(items) + b']}'
+
+    async def run_batch(self, session: aiohttp.ClientSession, index: int, item_count: int, body: bytes):
+        """提交一个批次并等待完成，然后流式读取结果"""
+        stats = {"index": index, "items": item_count, "bytes": len(body), "polls": 0}
+        start = time.time()
+
+        async with session.post(self.batches_url, data=body, headers=self.tester.headers,
+                                timeout=self.tester.timeouts.client_timeout()) as response:
+            if response.status != 200:
+                self.failed_batches[f"提交失败: {describe_http_error(response.status, await response.text())}"] += 1
+                return
+            batch = await response.json()
+        stats["id"] = batch["id"]
+        stats["submit"] = time.time() - start
+
+        # 轮询状态，间隔按 1.5 倍退避
+        # 单次轮询失败（非 200 或网络错误）不终止批次，下次继续；连续失败 poll_retries 次后放弃
+        interval = self.poll_interval
+        failures = 0
+        while batch.get("processing_status") != "ended":
+            await asyncio.sleep(interval)
+            interval = min(interval * 1.5, self.poll_max_interval)
+            stats["polls"] += 1
+            try:
+                async with session.get(f"{self.batches_url}/{batch['id']}", headers=self.tester.headers,
+                                       timeout=self.tester.timeouts.client_timeout()) as response:
+                    if response.status == 200:
+                        batch = await response.json()
+                        failures = 0
+                        continue
+                    error = describe_http_error(response.status, await response.text())
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__}: {str(e)}"
+            self.poll_errors[error] += 1
+            failures += 1
+            if failures >= self.poll_retries:
+                self.failed_batches[f"轮询连续失败 {failures} 次: {error}"] += 1
+                return
+        stats["completion"] = time.time() - start
+
+        # 流式读取结果文件（JSONL），逐行解析，不整体加载
+        download_start = time.time()
+        results_url = URL(self.batches_url).join(URL(batch["results_url"]))
+        async with session.get(results_url, headers=self.tester.headers,
+                               timeout=aiohttp.ClientTimeout(total=None, sock_read=self.tester.timeouts.total or None)) as response:
+            if response.status != 200:
+                self.failed_batches[f"结果下载失败: {describe_http_error(response.status, await response.text())}"] += 1
+                return
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                t0 = time.perf_counter()
+                result = json.loads(line).get("result", {})
+                self.tester.monitor.json_time += time.perf_counter() - t0
+
+                result_type = result.get("type", "unknown")
+                self.result_types[result_type] += 1
+                if result_type == "succeeded":
+                    usage = result.get("message", {}).get("usage", {})
+                    self.total_input_tokens += usage.get("input_tokens", 0)
+                    self.total_output_tokens += usage.get("output_tokens", 0)
+                elif result_type == "errored":
+                    error = result.get("error", {}).get("error", {})
+                    self.item_errors[f"{error.get('type', 'unknown')} - {error.get('message', '')}"] += 1
+        stats["download"] = time.time() - download_start
+        self.batch_stats.append(stats)
+
+    async def run(self):
+        """按并发数提交批次，所有批次结束后打印统计"""
+        tester = self.tester
+        print(f"\n{'='*60}")
+        print(f"Claude Message Batches API 吞吐测试")
+        print(f"{'='*60}")
+        print(f"端点: {self.batches_url}")
+        print(f"模型: {tester.model}")
+        print(f"每批请求数: {self.batch_size}")
+        print(f"同时处理的批次数: {tester.concurrency}")
+        print(f"请求来源: {self.source or f'语料库随机选择 ({tester.corpus.path})'}")
+        if tester.total_requests:
+            print(f"总请求数: {tester.total_requests} (约 {math.ceil(tester.total_requests / self.batch_size)} 个批次)")
+        print(f"开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"{'='*60}\n")
+
+        requests = self.iter_requests()
+        slots = asyncio.Semaphore(tester.concurrency)
+        tasks = []
+
+        async def run_in_slot(index: int, item_count: int, body: bytes):
+            try:
+                await self.run_batch(session, index, item_count, body)
+            except Exception as e:
+                self.failed_batches[f"Exception: {type(e).__name__}: {str(e)}"] += 1
+            finally:
+                slots.release()
+                done = len(self.batch_stats) + sum(self.failed_batches.values())
+                print(f"\r已完成批次: {len(self.batch_stats)} | 失败: {done - len(self.batch_stats)}", end="", flush=True)
+
+        connector = aiohttp.TCPConnector(limit=tester.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            start_time = time.time()
+            for index in itertools.count():
+                # 先占用并发槽位再构建下一批，避免提前在内存中堆积批次
+                await slots.acquire()
+                item_count, body = self.next_batch_body(requests)
+                if not item_count:
+                    slots.release()
+                    break
+                tasks.append(asyncio.create_task(run_in_slot(index, item_count, body)))
+            await asyncio.gather(*tasks)
+            total_time = time.time() - start_time
+
+        self.print_stats(total_time)
+
+    def print_stats(self, total_time: float):
+        """打印批次吞吐、完成时间和单条请求的结果分布"""
+        print(f"\n\n{'='*60}")
+        print(f"批次测试结果统计")
+        print(f"{'='*60}")
+
+        submitted_items = sum(b["items"] for b in self.batch_stats)
+        submitted_bytes = sum(b["bytes"] for b in self.batch_stats)
+        submit_time = sum(b["submit"] for b in self.batch_stats)
+        print(f"\n总体统计:")
+        print(f"  完成批次: {len(self.batch_stats)}")
+        print(f"  失败批次: {sum(self.failed_batches.values())}")
+        if self.reader is not None and self.reader.skipped:
+            print(f"  跳过无法解析的请求来源行: {self.reader.skipped}")
+        print(f"  总耗时: {total_time:.2f}s")
+        if total_time > 0:
+            print(f"  完成吞吐: {submitted_items / total_time:.1f} 请求/s")
+
+        if self.batch_stats:
+            print(f"\n提交吞吐:")
+            print(f"  提交请求数: {submitted_items:,}")
+            print(f"  提交数据量: {submitted_bytes / 2**20:.2f} MB")
+            if submit_time > 0:
+                print(f"  单批提交速率: {submitted_items / submit_time:,.0f} 请求/s, {submitted_bytes / 2**20 / submit_time:.2f} MB/s")
+            print(f"  平均轮询次数: {sum(b['polls'] for b in self.batch_stats) / len(self.batch_stats):.1f}/批次")
+
+            ClaudeLoadTester.print_time_stats("批次提交耗时", [b["submit"] for b in self.batch_stats])
+            ClaudeLoadTester.print_time_stats("批次完成耗时（提交到结束）", [b["completion"] for b in self.batch_stats])
+            ClaudeLoadTester.print_time_stats("结果下载耗时", [b["download"] for b in self.batch_stats])
+
+            # 批次中的每条请求都在批次结束时完成，按条数加权得到单条请求的完成耗时分布
+            per_request = []
+            for b in self.batch_stats:
+                per_request.extend([b["completion"]] * b["items"])
+            ClaudeLoadTester.print_time_stats("单条请求完成耗时", per_request)
+            print(f"  摊销耗时: {total_time / submitted_items * 1000:.2f}ms/请求")
+
+        total_items = sum(self.result_types.values())
+        if total_items:
+            succeeded = self.result_types.get("succeeded", 0)
+            print(f"\n单条请求结果:")
+            print(f"  成功率: {succeeded / total_items * 100:.2f}% ({succeeded:,}/{total_items:,})")
+            for result_type, count in sorted(self.result_types.items(), key=lambda x: x[1], reverse=True):
+                print(f"  {result_type}: {count:,}")
+
+        if self.total_input_tokens or self.total_output_tokens:
+            print(f"\nToken 使用统计:")
+            print(f"  输入 Tokens: {self.total_input_tokens:,}")
+            print(f"  输出 Tokens: {self.total_output_tokens:,}")
+
+        for title, errors in (("失败批次", self.failed_batches), ("轮询错误（已重试）", self.poll_errors),
+                              ("单条请求错误", self.item_errors)):
+            if errors:
+                print(f"\n{title}:")
+                for error_msg, count in sorted(errors.items(), key=lambda x: x[1], reverse=True):
+                    print(f"  [{count}次] {error_msg}")
+
+        print(f"\n{'='*60}\n")
+
+
+class TokenPlanner:
+    """运行前的 token 预算规划：估算每个请求的输入 tokens，结合计划请求数给出预计消耗
+
+    每个唯一的请求内容只调用一次 count_tokens，结果按内容哈希缓存到磁盘；接口不可用或指定
+    local_only 时改用本地估算（字节数 / 每 token 字节数，用缓存中的实测结果校准）
+    """
+
+    DEFAULT_BYTES_PER_TOKEN = 3.5  # 无校准样本时的默认值
+
+    def __init__(self, tester: ClaudeLoadTester, cache_path: str, local_only: bool = False):
+        self.tester = tester
+        self.cache_path = cache_path
+        self.local_only = local_only
+        self.count_url = tester.endpoint.rstrip("/") + "/count_tokens"
+        self.cache: Dict[str, Dict] = {}  # 内容哈希 -> {"tokens", "bytes", "source"}
+        if os.path.isfile(cache_path):
+            with open(cache_path, encoding="utf-8") as f:
+                self.cache = json.load(f)
+
+        self.cache_hits = 0
+        self.api_counts = 0
+        self.local_estimates = 0
+        self.api_error = ""
+
+    @staticmethod
+    def count_request(body: bytes) -> Tuple[str, bytes, int]:
+        """由请求体得到 count_tokens 请求体（去掉 max_tokens 等参数），返回 (内容哈希, 请求体, max_tokens)"""
+        payload = json.loads(body)
+        max_tokens = payload.pop("max_tokens", 0)
+        payload.pop("stream", None)
+        payload.pop("temperature", None)
+        count_body = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()
+        return hashlib.sha256(count_body).hexdigest(), count_body, max_tokens
+
+    def bytes_per_token(self) -> Tuple[float, int]:
+        """用缓存中 count_tokens 的实测结果校准本地估算系数，返回 (系数, 样本数)"""
+        samples = [v for v in self.cache.values() if v.get("source") == "api" and v["tokens"] > 0]
+        if not samples:
+            return self.DEFAULT_BYTES_PER_TOKEN, 0
+        return sum(v["bytes"] for v in samples) / sum(v["tokens"] for v in samples), len(samples)
+
+    async def count_tokens(self, session: aiohttp.ClientSession, key: str, count_body: bytes):
+        """调用 count_tokens 并写入缓存；失败时记录错误，之后全部改用本地估算"""
+        if self.api_error:
+            return
+        try:
+            async with session.post(self.count_url, data=count_body, headers=self.tester.headers,
+                                    timeout=self.tester.timeouts.client_timeout()) as response:
+                if response.status != 200:
+                    self.api_error = describe_http_error(response.status, await response.text())
+                    return
+                result = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.api_error = f"{type(e).__name__}: {str(e)}"
+            return
+        self.cache[key] = {"tokens": result["input_tokens"], "bytes": len(count_body), "source": "api"}
+        self.api_counts += 1
+
+    def iter_bodies(self, trace: Optional[TraceReader], source: Optional[str]) -> Iterator[bytes]:
+        """产出计划发送的请求体：轨迹 / JSONL 中的每一条，或语料库中的每条提示词（各一次）"""
+        limit = self.tester.total_requests or None
+        if trace is not None:
+            for _, entry in itertools.islice(trace, limit):
+                yield self.tester.build_request_body(trace_entry=entry)
+        elif source is not None:
+            for _, entry in itertools.islice(BatchSource(source), limit):
+                yield self.tester.build_request_body(trace_entry=entry)
+        else:
+            prefix, suffix = self.tester.payload_prefix, self.tester.payload_suffix
+            for i in range(len(self.tester.corpus)):
+                yield prefix + self.tester.corpus.encoded(i) + suffix
+
+    async def run(self, trace: Optional[TraceReader] = None, source: Optional[str] = None):
+        """统计每条请求的输入 tokens 和请求体大小，打印预计 token 消耗"""
+        occurrences = defaultdict(int)  # 内容哈希 -> 出现次数
+        count_bytes: Dict[str, int] = {}
+        body_sizes = []
+        total_max_tokens = 0
+        pending = {}
+
+        slots = asyncio.Semaphore(self.tester.concurrency)
+
+        async def count_in_slot(key: str, count_body: bytes):
+            async with slots:
+                await self.count_tokens(session, key, count_body)
+
+        async with aiohttp.ClientSession() as session:
+            for body in self.iter_bodies(trace, source):
+                key, count_body, max_tokens = self.count_request(body)
+                occurrences[key] += 1
+                body_sizes.append(len(body))
+                total_max_tokens += max_tokens
+                if key in count_bytes:
+                    continue
+                count_bytes[key] = len(count_body)
+                if key in self.cache:
+                    self.cache_hits += 1
+                elif not self.local_only:
+                    pending[key] = count_body
+                    # 分批并发调用，避免在内存中堆积大量待计数的请求体
+                    if len(pending) >= self.tester.concurrency * 4:
+                        await asyncio.gather(*(count_in_slot(k, b) for k, b in pending.items()))
+                        pending.clear()
+            if pending:
+                await asyncio.gather(*(count_in_slot(k, b) for k, b in pending.items()))
+
+        if self.api_counts:
+            with open(self.cache_path, "w", encoding="utf-8") as f:
+                json.dump(self.cache, f)
+
+        ratio, calibration_samples = self.bytes_per_token()
+        tokens: Dict[str, int] = {}
+        for key, size in count_bytes.items():
+            if key in self.cache:
+                tokens[key] = self.cache[key]["tokens"]
+            else:
+                tokens[key] = math.ceil(size / ratio)
+                self.local_estimates += 1
+
+        self.print_plan(occurrences, tokens, body_sizes, total_max_tokens, ratio, calibration_samples,
+                        from_corpus=trace is None and source is None)
+
+    def print_plan(self, occurrences: Dict[str, int], tokens: Dict[str, int], body_sizes: List[int],
+                   total_max_tokens: int, ratio: float, calibration_samples: int, from_corpus: bool):
+        tester = self.tester
+        print(f"\n{'='*60}")
+        print(f"Token 预算规划（未发送任何负载请求）")
+        print(f"{'='*60}")
+        if not body_sizes:
+            print(f"\n没有可规划的请求\n")
+            return
+
+        print(f"\n提示词:")
+        print(f"  唯一请求内容: {len(tokens)} (缓存命中 {self.cache_hits}, count_tokens {self.api_counts}, 本地估算 {self.local_estimates})")
+        if self.api_error:
+            print(f"  ⚠️  count_tokens 不可用，已改用本地估算: {self.api_error}")
+        calibration = f"基于 {calibration_samples} 个实测样本校准" if calibration_samples else "默认值，未校准"
+        print(f"  本地估算系数: {ratio:.2f} bytes/token ({calibration})")
+
+        per_request = [tokens[key] for key, count in occurrences.items() for _ in range(count)]
+        print(f"\n单请求:")
+        print(f"  输入 tokens: 平均 {sum(per_request) / len(per_request):,.0f} / 最小 {min(per_request):,} / 最大 {max(per_request):,}")
+        print(f"  请求体大小: 平均 {sum(body_sizes) / len(body_sizes):,.0f} bytes / 最大 {max(body_sizes):,} bytes")
+
+        if from_corpus:
+            # 每个请求从语料库随机选择：按平均值乘以计划请求数
+            requests = tester.total_requests
+            input_tokens = sum(per_request) / len(per_request) * requests
+            output_tokens = total_max_tokens / len(body_sizes) * requests
+            request_bytes = sum(body_sizes) / len(body_sizes) * requests
+        else:
+            requests = len(body_sizes)
+            input_tokens = sum(per_request)
+            output_tokens = total_max_tokens
+            request_bytes = sum(body_sizes)
+
+        print(f"\n预计消耗（{requests:,} 个请求）:")
+        print(f"  输入 Tokens: {input_tokens:,.0f}")
+        print(f"  输出 Tokens 上限: {output_tokens:,.0f} (按 max_tokens)")
+        print(f"  总计 Tokens 上限: {input_tokens + output_tokens:,.0f}")
+        print(f"  请求数据量: {request_bytes / 2**20:.2f} MB")
+        if tester.session_turns > 0:
+            print(f"  注意: 多轮会话模式下每轮会重发增长的上下文，实际输入 tokens 会明显高于单轮估算")
+        if tester.hedge_delay or tester.hedge_percentile:
+            print(f"  注意: 对冲请求会额外消耗 tokens，未计入以上估算")
         print(f"\n{'='*60}\n")
 
 
@@ -931,21 +1971,165 @@ def main():
     parser.add_argument("-e", "--endpoint", required=True, help="Claude API 端点 URL (例如: https://api.anthropic.com/v1/messages)")
     parser.add_argument("-k", "--api-key", required=True, help="API Key")
     parser.add_argument("-c", "--concurrency", type=int, default=10, help="并发数 (默认: 10)")
-    parser.add_argument("-n", "--num-requests", type=int, default=100, help="总请求数 (默认: 100)")
+    parser.add_argument("-n", "--num-requests", type=int, help="总请求数 (默认: 100；轨迹回放模式下默认回放整个轨迹)")
     parser.add_argument("-m", "--model", default="claude-sonnet-4-5-20250929", help="模型名称 (默认: claude-sonnet-4-5-20250929)")
+    parser.add_argument("--response-mode", choices=ClaudeLoadTester.RESPONSE_MODES, default="full",
+                        help="响应处理模式: full 解析完整 JSON; usage 分块读取并只扫描 usage/stop_reason，降低客户端 CPU (默认: full)")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="提示词语料库文件，可用 prompt_corpus.py 构建 (默认: prompts/default.corpus)")
+    parser.add_argument("--transport", choices=list(TRANSPORTS), default="aiohttp",
+                        help="HTTP 传输后端: aiohttp; raw 基于 asyncio streams 的 HTTP/1.1 keep-alive 客户端; "
+                             "httpx 启用 HTTP/2 多路复用，需 pip install 'httpx[http2]' (默认: aiohttp)")
+    parser.add_argument("--event-loop", choices=EVENT_LOOPS, default="asyncio",
+                        help="事件循环实现: asyncio 或 uvloop，uvloop 需 pip install uvloop (默认: asyncio)")
+    parser.add_argument("--replay-trace", help="轨迹回放: 带时间戳的请求日志 (JSONL 或 .jsonl.gz)，按原始到达间隔发送")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="轨迹回放速度倍率，10 表示时间压缩为 1/10 (默认: 1)")
+    parser.add_argument("--trace-time-field", default="timestamp", help="轨迹中时间戳字段名，epoch 秒或 ISO 8601 (默认: timestamp)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Message Batches API 模式: 把请求打包为批次提交到 <endpoint>/batches，轮询并读取结果；-c 为同时处理的批次数")
+    parser.add_argument("--batch-size", type=int, default=100, help="批次模式: 每批请求数 (默认: 100)")
+    parser.add_argument("--batch-source", help="批次模式: 请求来源 JSONL，每行 {\"custom_id\"?, \"prompt\" | \"body\"} (默认: 语料库随机选择)")
+    parser.add_argument("--batch-poll-interval", type=float, default=5, help="批次模式: 初始轮询间隔秒数，按 1.5 倍退避 (默认: 5)")
+    parser.add_argument("--batch-poll-max", type=float, default=60, help="批次模式: 最大轮询间隔秒数 (默认: 60)")
+    parser.add_argument("--batch-poll-retries", type=int, default=5,
+                        help="批次模式: 连续轮询失败（非 200 或网络错误）达到该次数后放弃批次并记为失败 (默认: 5)")
+    parser.add_argument("--plan", action="store_true",
+                        help="只做 token 预算规划: 估算每个请求的输入 tokens 并打印预计消耗，不发送负载请求")
+    parser.add_argument("--plan-local", action="store_true", help="规划时不调用 count_tokens，只用本地估算")
+    parser.add_argument("--token-cache", default=".token_count_cache.json",
+                        help="count_tokens 结果缓存文件，按内容哈希索引 (默认: .token_count_cache.json)")
+    parser.add_argument("--scenario", dest="scenarios", action="append", type=RequestScenarios.parse, default=[],
+                        metavar="NAME[:WEIGHT]",
+                        help="请求场景，可重复指定并按权重混合: text 纯文本; tools 附带大量工具定义; "
+                             "tool-loop 多步工具循环（回填合成 tool_result）; image 附带 PNG 图片。例如 --scenario tools:3 --scenario image:1")
+    parser.add_argument("--tool-count", type=int, default=16, help="场景模式: 工具定义数量 (默认: 16)")
+    parser.add_argument("--tool-loop-steps", type=int, default=4, help="场景模式: 每个工具循环最多的请求数 (默认: 4)")
+    parser.add_argument("--tool-result-bytes", type=int, default=4096, help="场景模式: 每个合成 tool_result 的字节数 (默认: 4096)")
+    parser.add_argument("--image-bytes", type=int, default=256 * 1024, help="场景模式: 图片大小（base64 编码前）字节数 (默认: 262144)")
+    parser.add_argument("--slowest", type=int, default=10, help="延迟归因报告中列出的最慢请求数，0 表示不列出 (默认: 10)")
+    parser.add_argument("--server-time-header", dest="server_time_headers", action="append", default=[], metavar="HEADER",
+                        help="报告服务端处理耗时的响应头（默认按毫秒，带 s 后缀时按秒），可重复指定，优先于默认的 server-timing / x-envoy-upstream-service-time")
+    parser.add_argument("--request-log", help="把每个请求的延迟归因（request-id、客户端 / 网络 / 服务端耗时）写入该 JSONL 文件")
+    parser.add_argument("--session-turns", type=int, default=0,
+                        help="多轮会话模式: 每个虚拟用户的会话最多轮数，每轮追加实际回复和追问 (默认: 0，不启用)")
+    parser.add_argument("--session-token-budget", type=int, default=0,
+                        help="多轮会话模式: 单轮输入 tokens 达到该值后结束会话 (默认: 0，不限制)")
+    parser.add_argument("--timeout", type=float, default=60, help="单个请求的总超时秒数，0 表示不限制 (默认: 60)")
+    parser.add_argument("--connect-timeout", type=float, default=0, help="建立连接超时秒数 (默认: 0，不限制)")
+    parser.add_argument("--first-byte-timeout", type=float, default=0, help="首字节（收到响应头）超时秒数 (默认: 0，不限制)")
+    parser.add_argument("--idle-timeout", type=float, default=0, help="响应体分块之间的最大间隔秒数 (默认: 0，不限制)")
+    parser.add_argument("--hedge-delay", type=parse_hedge_delay,
+                        help="启用对冲请求: 主请求超过该延迟仍未完成时发送重复请求，取先成功者。"
+                             "可为固定值 (500ms / 2s) 或已观测延迟的百分位 (p95)")
+    parser.add_argument("--hedge-observe-loser", action="store_true",
+                        help="对冲胜出后不取消主请求，让其跑完以测量未对冲时的真实延迟（会增加负载）")
+    parser.add_argument("--slo", dest="guards", action="append", type=SloGuard.parse, default=[], metavar="RULE",
+                        help="SLO 守护规则，可重复指定。格式 <指标>><阈值>[:<动作>]，指标: error_rate/p50/p90/p95/p99/tokens，"
+                             "动作: abort/cancel/pause (默认 abort)。例如 --slo 'error_rate>5%%' --slo 'p95>30s:pause'")
+    parser.add_argument("--slo-window", type=float, default=60, help="SLO 滚动窗口秒数 (默认: 60)")
+    parser.add_argument("--slo-min-samples", type=int, default=20, help="窗口内少于该样本数时不评估错误率/延迟规则 (默认: 20)")
+    parser.add_argument("--max-loop-lag", type=float, default=50, help="客户端饱和阈值: 事件循环延迟 ms (默认: 50)")
+    parser.add_argument("--max-client-cpu", type=float, default=90, help="客户端饱和阈值: 进程 CPU 使用率 %% (默认: 90)")
+    parser.add_argument("--max-send-lag", type=float, default=50, help="客户端饱和阈值: 实际发送晚于计划的 ms (默认: 50)")
+    parser.add_argument("--saturation-action", choices=SaturationMonitor.ACTIONS, default="warn",
+                        help="客户端饱和时的处理: warn 仅告警; throttle 暂停发送直到恢复; abort 停止测试 (默认: warn)")
 
     args = parser.parse_args()
 
+    if args.session_turns > 0 and args.response_mode == "usage":
+        parser.error("多轮会话模式需要助手回复内容，不能与 --response-mode usage 同时使用")
+    if args.session_turns > 0 and args.replay_trace:
+        parser.error("多轮会话模式不能与 --replay-trace 同时使用")
+    if args.replay_trace and not os.path.isfile(args.replay_trace):
+        parser.error(f"轨迹文件不存在: {args.replay_trace}")
+    if args.replay_speed <= 0:
+        parser.error("--replay-speed 必须大于 0")
+
+    if args.batch and (args.session_turns > 0 or args.replay_trace or args.hedge_delay):
+        parser.error("--batch 不能与多轮会话、轨迹回放或对冲请求同时使用")
+    if args.scenarios and (args.session_turns > 0 or args.replay_trace or args.batch or args.plan):
+        parser.error("--scenario 不能与多轮会话、轨迹回放、批次模式或 --plan 同时使用")
+    if any(name == "tool-loop" for name, _ in args.scenarios) and args.response_mode == "usage":
+        parser.error("tool-loop 场景需要助手回复内容，不能与 --response-mode usage 同时使用")
+    if args.batch_poll_retries < 1:
+        parser.error("--batch-poll-retries 至少为 1")
+    if args.batch_source and not os.path.isfile(args.batch_source):
+        parser.error(f"批次请求来源文件不存在: {args.batch_source}")
+    if not os.path.isfile(args.corpus):
+        parser.error(f"语料库文件不存在: {args.corpus}")
+    try:
+        PromptCorpus(args.corpus).close()
+    except ValueError as e:
+        parser.error(str(e))
+
+    for name in (args.transport, args.event_loop):
+        if name in ("httpx", "uvloop"):
+            try:
+                require_optional(name)
+            except RuntimeError as e:
+                parser.error(str(e))
+    install_event_loop(args.event_loop)
+
+    if args.num_requests is None:
+        args.num_requests = 0 if (args.replay_trace or args.batch_source) else 100
+
     # 创建测试器并运行
     tester = ClaudeLoadTester(
         endpoint=args.endpoint,
         api_key=args.api_key,
         concurrency=args.concurrency,
         total_requests=args.num_requests,
-        model=args.model
+        model=args.model,
+        response_mode=args.response_mode,
+        monitor=SaturationMonitor(
+            max_loop_lag_ms=args.max_loop_lag,
+            max_cpu_percent=args.max_client_cpu,
+            max_send_lag_ms=args.max_send_lag,
+            action=args.saturation_action
+        ),
+        session_turns=args.session_turns,
+        session_token_budget=args.session_token_budget,
+        corpus_path=args.corpus,
+        trace=TraceReader(args.replay_trace, args.trace_time_field) if args.replay_trace else None,
+        replay_speed=args.replay_speed,
+        guards=args.guards,
+        guard_window=args.slo_window,
+        guard_min_samples=args.slo_min_samples,
+        timeouts=RequestTimeouts(
+            total=args.timeout,
+            connect=args.connect_timeout,
+            first_byte=args.first_byte_timeout,
+            idle=args.idle_timeout
+        ),
+        hedge_delay=args.hedge_delay[0] if args.hedge_delay else 0,
+        hedge_percentile=args.hedge_delay[1] if args.hedge_delay else 0,
+        hedge_observe_loser=args.hedge_observe_loser,
+        transport=args.transport,
+        scenarios=RequestScenarios(
+            args.scenarios,
+            tool_count=args.tool_count,
+            tool_loop_steps=args.tool_loop_steps,
+            tool_result_bytes=args.tool_result_bytes,
+            image_bytes=args.image_bytes
+        ) if args.scenarios else None,
+        slowest=args.slowest,
+        server_time_headers=args.server_time_headers,
+        request_log=args.request_log
     )
 
+    if args.plan:
+        planner = TokenPlanner(tester, cache_path=args.token_cache, local_only=args.plan_local)
+        asyncio.run(planner.run(trace=tester.trace, source=args.batch_source))
+        sys.exit(EXIT_OK)
+
+    if args.batch:
+        batch_tester = BatchTester(tester, batch_size=args.batch_size, source=args.batch_source,
+                                   poll_interval=args.batch_poll_interval, poll_max_interval=args.batch_poll_max,
+                                   poll_retries=args.batch_poll_retries)
+        asyncio.run(batch_tester.run())
+        sys.exit(EXIT_OK)
+
     asyncio.run(tester.run_test())
+    sys.exit(tester.exit_code)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+压缩提示词语料库
+功能：把测试提示词存放在外部语料文件中，按需加载单条提示词，避免导入时解析并常驻全部提示词
+
+文件格式（小端）:
+  MAGIC                          5 字节
+  记录 * N                        每条为 zlib 压缩后的「JSON 编码字符串字面量」
+  索引                            zlib 压缩的 JSON: {"names": [...], "offsets": [...], "lengths": [...]}
+  FOOTER                         <QQ: 索引偏移, 索引长度>
+
+记录直接保存 JSON 编码后的字符串，发送请求时可原样拼进请求体，无需在运行时再次序列化。
+"""
+
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import zlib
+from array import array
+from collections import OrderedDict
+from typing import Iterable, List, Tuple
+
+MAGIC = b"CLPC\x01"
+FOOTER = struct.Struct("<QQ")
+
+
+class PromptCorpus:
+    """只读语料库：打开时只读取索引，提示词在首次使用时解压并缓存（LRU）"""
+
+    def __init__(self, path: str, cache_size: int = 256):
+        self.path = path
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[int, bytes]" = OrderedDict()
+
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} 不是有效的语料库文件")
+
+        index_offset, index_length = FOOTER.unpack(self._data[-FOOTER.size:])
+        index = json.loads(zlib.decompress(self._data[index_offset:index_offset + index_length]))
+        self.names: List[str] = index["names"]
+        self._offsets = array("Q", index["offsets"])
+        self._lengths = array("I", index["lengths"])
+        if not self._offsets:
+            self._data.close()
+            raise ValueError(f"{path} 中没有提示词")
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def encoded(self, i: int) -> bytes:
+        """返回第 i 条提示词的 JSON 编码字节（含引号），可直接拼接进请求体"""
+        cached = self._cache.get(i)
+        if cached is not None:
+            self._cache.move_to_end(i)
+            return cached
+
+        offset = self._offsets[i]
+        encoded = zlib.decompress(self._data[offset:offset + self._lengths[i]])
+        self._cache[i] = encoded
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return encoded
+
+    def text(self, i: int) -> str:
+        """返回第 i 条提示词的文本"""
+        return json.loads(self.encoded(i))
+
+    def random_index(self) -> int:
+        return random.randrange(len(self._offsets))
+
+    def close(self):
+        self._data.close()
+
+
+def build_corpus(prompts: Iterable[Tuple[str, str]], path: str, level: int = 9) -> int:
+    """把 (名称, 提示词) 序列写成语料库文件，返回条数；没有提示词时删除输出文件并抛出 ValueError"""
+    names, offsets, lengths = [], [], []
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        for name, prompt in prompts:
+            record = zlib.compress(json.dumps(prompt, ensure_ascii=False).encode(), level)
+            names.append(name)
+            offsets.append(f.tell())
+            lengths.append(len(record))
+            f.write(record)
+
+        if not names:
+            f.close()
+            os.remove(path)
+            raise ValueError("没有可写入的提示词，语料库至少需要一条记录")
+
+        index = zlib.compress(json.dumps({"names": names, "offsets": offsets, "lengths": lengths},
+                                         ensure_ascii=False).encode(), level)
+        index_offset = f.tell()
+        f.write(index)
+        f.write(FOOTER.pack(index_offset, len(index)))
+    return len(names)
+
+
+def read_jsonl(path: str) -> Iterable[Tuple[str, str]]:
+    """逐行读取 {"name": ..., "prompt": ...} 格式的 JSONL"""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            yield item.get("name", f"prompt-{line_no}"), item["prompt"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="提示词语料库工具",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 导出默认语料为 JSONL，编辑后重新构建
+  python prompt_corpus.py extract prompts/default.corpus -o prompts.jsonl
+  python prompt_corpus.py build prompts.jsonl -o prompts/default.corpus
+
+  # 查看语料库内容
+  python prompt_corpus.py list prompts/default.corpus
+        """
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="从 JSONL ({\"name\", \"prompt\"}) 构建语料库")
+    build_parser.add_argument("source", help="JSONL 源文件")
+    build_parser.add_argument("-o", "--output", required=True, help="输出语料库文件")
+
+    extract_parser = subparsers.add_parser("extract", help="把语料库导出为 JSONL")
+    extract_parser.add_argument("corpus", help="语料库文件")
+    extract_parser.add_argument("-o", "--output", help="输出 JSONL 文件 (默认: 标准输出)")
+
+    list_parser = subparsers.add_parser("list", help="列出语料库中的提示词")
+    list_parser.add_argument("corpus", help="语料库文件")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        try:
+            count = build_corpus(read_jsonl(args.source), args.output)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"已写入 {count} 条提示词到 {args.output}")
+    elif args.command == "extract":
+        corpus = PromptCorpus(args.corpus)
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        for i in range(len(corpus)):
+            out.write(json.dumps({"name": corpus.names[i], "prompt": corpus.text(i)}, ensure_ascii=False) + "\n")
+        if args.output:
+            out.close()
+    else:
+        corpus = PromptCorpus(args.corpus)
+        for i in range(len(corpus)):
+            print(f"{i:>4}  {len(corpus.text(i)):>7,} 字符  {corpus.names[i]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+本地模拟 Claude API 服务
+功能：模拟 /v1/messages、count_tokens 和 Message Batches API（/v1/messages/batches），用于基准测试和离线验证负载测试工具，
+不消耗真实 tokens。请求强制调用工具（tool_choice 为 any / tool）时返回 tool_use 响应，用于验证工具循环；
+响应带 request-id 和 x-envoy-upstream-service-time 头，用于验证延迟归因。可在后台线程中运行（StandInServer），也可以单独启动
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from typing import Dict, List
+
+from aiohttp import web
+
+
+class StandInServer:
+    """在后台线程的独立事件循环中运行的本地模拟服务，/v1/messages 立即返回固定响应"""
+
+    def __init__(self, response_text_bytes: int = 2048, port: int = 0,
+                 batch_base_seconds: float = 1.0, batch_seconds_per_item: float = 0.001, batch_error_rate: float = 0.0):
+        self.response_message = {
+            "id": "msg_stand_in",
+            "type": "message",
+            "role": "assistant",
+            "model": "stand-in",
+            "content": [{"type": "text", "text": "x" * response_text_bytes}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 800, "output_tokens": response_text_bytes // 4}
+        }
+        self.response_body = json.dumps(self.response_message).encode()
+        self.port = port
+        # 批次处理耗时 = 基础耗时 + 每条请求耗时 * 条数
+        self.batch_base_seconds = batch_base_seconds
+        self.batch_seconds_per_item = batch_seconds_per_item
+        self.batch_error_rate = batch_error_rate
+        self.batches: Dict[str, Dict] = {}
+        self._batch_ids = itertools.count(1)
+        self._tool_use_ids = itertools.count(1)
+        self._request_ids = itertools.count(1)
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    async def handle_messages(self, request: web.Request) -> web.Response:
+        start = time.perf_counter()
+        body = await request.read()
+        message = None
+        if b'"tool_choice"' in body:
+            payload = json.loads(body)
+            tool_choice = payload.get("tool_choice") or {}
+            if tool_choice.get("type") in ("any", "tool") and payload.get("tools"):
+                message = self.tool_use_message(payload["tools"], tool_choice)
+        headers = {
+            "request-id": f"req_stand_in_{next(self._request_ids):010d}",
+            "x-envoy-upstream-service-time": str(round((time.perf_counter() - start) * 1000)),
+        }
+        if message is not None:
+            return web.json_response(message, headers=headers)
+        return web.Response(body=self.response_body, content_type="application/json", headers=headers)
+
+    def tool_use_message(self, tools: List[Dict], tool_choice: Dict) -> Dict:
+        """强制调用工具时的响应：调用 tool_choice 指定的工具，否则随机选一个"""
+        name = tool_choice.get("name") or random.choice(tools)["name"]
+        return {
+            **self.response_message,
+            "content": [{"type": "tool_use", "id": f"toolu_stand_in_{next(self._tool_use_ids):08d}",
+                         "name": name, "input": {}}],
+            "stop_reason": "tool_use",
+            "usage": {"input_tokens": self.response_message["usage"]["input_tokens"], "output_tokens": 40},
+        }
+
+    async def handle_count_tokens(self, request: web.Request) -> web.Response:
+        """按请求体字节数粗略模拟 token 计数"""
+        body = await request.read()
+        return web.json_response({"input_tokens": max(1, len(body) // 4)})
+
+    def batch_object(self, request: web.Request, batch: Dict) -> Dict:
+        """按当前时间生成批次状态"""
+        ended = time.time() >= batch["ends_at"]
+        total = len(batch["custom_ids"])
+        errored = batch["errored"] if ended else 0
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": total - errored if ended else 0,
+                "errored": errored,
+                "canceled": 0,
+                "expired": 0
+            },
+            "created_at": batch["created_at"],
+            "ended_at": batch["ended_at"] if ended else None,
+            "results_url": str(request.url.with_path(f"/v1/messages/batches/{batch['id']}/results")) if ended else None
+        }
+
+    async def handle_create_batch(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        custom_ids = [item["custom_id"] for item in data.get("requests", [])]
+        if not custom_ids:
+            return web.json_response({"type": "error", "error": {"type": "invalid_request_error",
+                                                                  "message": "requests: at least one request is required"}},
+                                     status=400)
+        batch_id = f"msgbatch_{next(self._batch_ids):06d}"
+        ends_at = time.time() + self.batch_base_seconds + self.batch_seconds_per_item * len(custom_ids)
+        batch = {
+            "id": batch_id,
+            "custom_ids": custom_ids,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "ends_at": ends_at,
+            "ended_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ends_at)),
+            "errored": sum(1 for _ in custom_ids if random.random() < self.batch_error_rate),
+        }
+        self.batches[batch_id] = batch
+        return web.json_response(self.batch_object(request, batch))
+
+    async def handle_get_batch(self, request: web.Request) -> web.Response:
+        batch = self.batches.get(request.match_info["batch_id"])
+        if batch is None:
+            return web.json_response({"type": "error", "error": {"type": "not_found_error", "message": "batch not found"}},
+                                     status=404)
+        return web.json_response(self.batch_object(request, batch))
+
+    async def handle_batch_results(self, request: web.Request) -> web.StreamResponse:
+        batch = self.batches.get(request.match_info["batch_id"])
+        if batch is None or time.time() < batch["ends_at"]:
+            return web.json_response({"type": "error", "error": {"type": "not_found_error", "message": "results not available"}},
+                                     status=404)
+
+        response = web.StreamResponse(headers={"content-type": "application/binary"})
+        await response.prepare(request)
+        succeeded_line = json.dumps({"type": "succeeded", "message": self.response_message})
+        errored_line = json.dumps({"type": "errored", "error": {"type": "error", "error": {
+            "type": "overloaded_error", "message": "Overloaded"}}})
+        errored = batch["errored"]
+        for i, custom_id in enumerate(batch["custom_ids"]):
+            result = errored_line if i < errored else succeeded_line
+            await response.write(f'{{"custom_id": {json.dumps(custom_id)}, "result": {result}}}\n'.encode())
+        await response.write_eof()
+        return response
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=256 * 1024 * 1024)
+        app.router.add_post("/v1/messages", self.handle_messages)
+        app.router.add_post("/v1/messages/count_tokens", self.handle_count_tokens)
+        app.router.add_post("/v1/messages/batches", self.handle_create_batch)
+        app.router.add_get("/v1/messages/batches/{batch_id}", self.handle_get_batch)
+        app.router.add_get("/v1/messages/batches/{batch_id}/results", self.handle_batch_results)
+        return app
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._start())
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1/messages"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def __exit__(self, *exc):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 Claude API 服务（/v1/messages、count_tokens 与 Message Batches API）")
+    parser.add_argument("-p", "--port", type=int, default=8080, help="监听端口 (默认: 8080)")
+    parser.add_argument("--response-bytes", type=int, default=2048, help="响应中文本的字节数 (默认: 2048)")
+    parser.add_argument("--batch-base-seconds", type=float, default=1.0, help="每个批次的基础处理耗时 (默认: 1.0)")
+    parser.add_argument("--batch-seconds-per-item", type=float, default=0.001, help="批次中每条请求的处理耗时 (默认: 0.001)")
+    parser.add_argument("--batch-error-rate", type=float, default=0.0, help="批次中每条请求返回 errored 的概率 (默认: 0)")
+    args = parser.parse_args()
+
+    server = StandInServer(response_text_bytes=args.response_bytes, port=args.port,
+                           batch_base_seconds=args.batch_base_seconds,
+                           batch_seconds_per_item=args.batch_seconds_per_item,
+                           batch_error_rate=args.batch_error_rate)
+    with server:
+        print(f"模拟服务已启动: {server.endpoint} (Ctrl+C 退出)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+HTTP 传输后端
+功能：把 send_request 用到的 HTTP 操作抽象为一个小接口，便于比较不同客户端实现的开销
+
+后端:
+  aiohttp  - 默认，aiohttp.ClientSession
+  raw      - 基于 asyncio streams 的最小 HTTP/1.1 keep-alive 客户端，无额外依赖
+  httpx    - httpx.AsyncClient，启用 HTTP/2 多路复用（可选依赖: pip install 'httpx[http2]'）
+"""
+
+import asyncio
+import ssl
+import time
+from collections import deque
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+
+class RequestTimeouts:
+    """分阶段超时（秒，0 表示不限制）：建立连接、首字节（收到响应头）、响应体分块间隔、总计"""
+
+    def __init__(self, total: float = 60, connect: float = 0, first_byte: float = 0, idle: float = 0):
+        self.total = total
+        self.connect = connect
+        self.first_byte = first_byte
+        self.idle = idle
+
+    def client_timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=self.total or None, sock_connect=self.connect or None)
+
+
+class PhaseTimeout(Exception):
+    """某个阶段超时（连接 / 首字节 / 分块间隔）"""
+
+    def __init__(self, phase: str, limit: float):
+        super().__init__(f"{phase} (>{limit:g}s)")
+        self.phase = phase
+        self.limit = limit
+
+
+class TransportError(Exception):
+    """传输层错误（连接断开、协议错误等），对应 aiohttp.ClientError"""
+
+
+async def wait_phase(awaitable, phase: str, limit: float):
+    """等待 awaitable，超过 limit 秒时抛出 PhaseTimeout；limit 为 0 表示不限制
+
+    只有本函数自身的计时到期才转换为 PhaseTimeout，其它超时（如总超时）原样抛出
+    """
+    if not limit:
+        return await awaitable
+    start = time.monotonic()
+    try:
+        return await asyncio.wait_for(awaitable, limit)
+    except asyncio.TimeoutError:
+        if time.monotonic() - start >= limit * 0.99:
+            raise PhaseTimeout(phase, limit)
+        raise
+
+
+async def within_deadline(awaitable, deadline: Optional[float]):
+    """在截止时间（time.monotonic）前等待，超时抛出 asyncio.TimeoutError（归类为总超时）"""
+    if deadline is None:
+        return await awaitable
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        awaitable.close()
+        raise asyncio.TimeoutError()
+    return await asyncio.wait_for(awaitable, remaining)
+
+
+class TransportResponse:
+    """已收到响应头的响应；作为异步上下文管理器使用，退出时释放连接"""
+
+    status: int = 0
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline  # 总超时的截止时间（time.monotonic），None 表示不限制
+
+    def header(self, name: str) -> Optional[str]:
+        """按名称（不区分大小写）读取响应头"""
+        raise NotImplementedError
+
+    async def read_chunk(self) -> bytes:
+        """读取下一个响应体分块，读完返回 b\"\""""
+        raise NotImplementedError
+
+    async def read(self) -> bytes:
+        """读取完整响应体"""
+        chunks = []
+        while True:
+            chunk = await self.read_chunk()
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    async def release(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.release()
+
+
+class Transport:
+    """HTTP 传输后端接口：post() 在收到响应头后返回 TransportResponse"""
+
+    name = ""
+
+    def __init__(self, limit: int):
+        self.limit = limit  # 最大连接数
+
+    async def post(self, url: str, data: bytes, headers: Dict[str, str], timeouts: RequestTimeouts) -> TransportResponse:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class AiohttpResponse(TransportResponse):
+    def __init__(self, response: aiohttp.ClientResponse):
+        super().__init__()
+        self.response = response
+        self.status = response.status
+
+    def header(self, name: str) -> Optional[str]:
+        return self.response.headers.get(name)
+
+    async def read_chunk(self) -> bytes:
+        return await self.response.content.readany()
+
+    async def read(self) -> bytes:
+        return await self.response.read()
+
+    async def release(self):
+        self.response.release()
+
+
+class AiohttpTransport(Transport):
+    """默认后端：aiohttp.ClientSession（超时由 aiohttp.ClientTimeout 处理）"""
+
+    name = "aiohttp"
+
+    def __init__(self, limit: int):
+        super().__init__(limit)
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=limit))
+
+    async def post(self, url: str, data: bytes, headers: Dict[str, str], timeouts: RequestTimeouts) -> TransportResponse:
+        response = await self.session.post(url, data=data, headers=headers, timeout=timeouts.client_timeout())
+        return AiohttpResponse(response)
+
+    async def close(self):
+        await self.session.close()
+
+
+class RawConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+    def close(self):
+        self.writer.close()
+
+
+class RawResponse(TransportResponse):
+    """HTTP/1.1 响应：支持 Content-Length、chunked 和读到连接关闭三种响应体"""
+
+    def __init__(self, transport: "RawHttpTransport", conn: RawConnection, status: int,
+                 headers: Dict[str, str], deadline: Optional[float]):
+        super().__init__(deadline)
+        self.transport = transport
+        self.conn = conn
+        self.status = status
+        self.headers = headers
+        self.chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        length = headers.get("content-length")
+        self.remaining = int(length) if length is not None and not self.chunked else None
+        self.keep_alive = headers.get("connection", "").lower() != "close" and (self.chunked or self.remaining is not None)
+        self.done = False
+
+    def header(self, name: str) -> Optional[str]:
+        return self.headers.get(name.lower())
+
+    async def _read_chunk(self) -> bytes:
+        reader = self.conn.reader
+        if self.chunked:
+            # readline 返回空串说明连接已关闭，不能当作响应体结束（否则会把断开的连接放回连接池）
+            size_line = await reader.readline()
+            if not size_line:
+                raise TransportError("连接在响应体读完前关闭")
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                # 读掉 trailer 直到空行
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        raise TransportError("连接在响应体读完前关闭")
+                    if line in (b"\r\n", b"\n"):
+                        break
+                self.done = True
+                return b""
+            data = await reader.readexactly(size)
+            if not await reader.readline():
+                raise TransportError("连接在响应体读完前关闭")
+            return data
+
+        if self.remaining is None:
+            data = await reader.read(self.transport.READ_SIZE)
+            self.done = not data
+            return data
+        if self.remaining == 0:
+            self.done = True
+            return b""
+        data = await reader.read(min(self.remaining, self.transport.READ_SIZE))
+        if not data:
+            raise TransportError("连接在响应体读完前关闭")
+        self.remaining -= len(data)
+        return data
+
+    async def read_chunk(self) -> bytes:
+        if self.done:
+            return b""
+        try:
+            return await within_deadline(self._read_chunk(), self.deadline)
+        except (asyncio.IncompleteReadError, ValueError) as e:
+            raise TransportError(f"响应体格式错误: {e}")
+
+    async def release(self):
+        # 只有响应体完整读完且允许 keep-alive 时才放回连接池
+        self.transport.release(self.conn, reusable=self.done and self.keep_alive)
+
+
+class RawHttpTransport(Transport):
+    """基于 asyncio streams 的最小 HTTP/1.1 keep-alive 客户端
+
+    只实现负载测试需要的部分：POST、连接池复用、Content-Length / chunked 响应体；
+    空闲连接被服务端关闭时自动用新连接重试一次
+    """
+
+    name = "raw"
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, limit: int):
+        super().__init__(limit)
+        self.idle = deque()
+        self.slots = asyncio.Semaphore(limit)
+        self.ssl_context = ssl.create_default_context()
+
+    async def connect(self, host: str, port: int, use_ssl: bool, timeouts: RequestTimeouts) -> RawConnection:
+        opening = asyncio.open_connection(host, port, ssl=self.ssl_context if use_ssl else None)
+        try:
+            reader, writer = await wait_phase(opening, "connect", timeouts.connect)
+        except OSError as e:
+            raise TransportError(f"无法连接 {host}:{port}: {e}")
+        return RawConnection(reader, writer)
+
+    def release(self, conn: RawConnection, reusable: bool):
+        if reusable:
+            conn.reused = True
+            self.idle.append(conn)
+        else:
+            conn.close()
+        self.slots.release()
+
+    async def post(self, url: str, data: bytes, headers: Dict[str, str], timeouts: RequestTimeouts) -> TransportResponse:
+        deadline = time.monotonic() + timeouts.total if timeouts.total else None
+        parts = urlsplit(url)
+        use_ssl = parts.scheme == "https"
+        host = parts.hostname
+        port = parts.port or (443 if use_ssl else 80)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        host_header = host if parts.port is None else f"{host}:{port}"
+
+        head = [f"POST {path} HTTP/1.1", f"Host: {host_header}", f"Content-Length: {len(data)}", "Connection: keep-alive"]
+        head.extend(f"{k}: {v}" for k, v in headers.items())
+        request = ("\r\n".join(head) + "\r\n\r\n").encode() + data
+
+        return await within_deadline(self._post(host, port, use_ssl, request, timeouts, deadline), deadline)
+
+    async def _post(self, host: str, port: int, use_ssl: bool, request: bytes, timeouts: RequestTimeouts,
+                    deadline: Optional[float]) -> "RawResponse":
+        await self.slots.acquire()
+        conn = None
+        try:
+            for attempt in range(2):
+                # 重试时一定新建连接：其余空闲连接多半也已超过服务端 keep-alive 超时
+                if attempt == 0 and self.idle:
+                    conn = self.idle.popleft()
+                else:
+                    conn = await self.connect(host, port, use_ssl, timeouts)
+                try:
+                    conn.writer.write(request)
+                    await conn.writer.drain()
+                    status_line = await conn.reader.readline()
+                except (ConnectionError, OSError):
+                    status_line = b""
+                if status_line:
+                    break
+                # 复用的空闲连接已被服务端关闭：换新连接重试一次
+                conn.close()
+                if not conn.reused or attempt == 1:
+                    raise TransportError("服务端关闭了连接")
+
+            try:
+                status = status_line.split()[1]
+                response_headers = {}
+                while True:
+                    line = await conn.reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    response_headers[name.strip().lower()] = value.strip()
+                return RawResponse(self, conn, int(status), response_headers, deadline)
+            except ValueError:
+                raise TransportError(f"无效的响应状态行: {status_line[:100]!r}")
+        except BaseException:
+            # 未能交给 RawResponse 时（出错或被取消）关闭连接并归还槽位，成功时由 RawResponse.release 归还
+            if conn is not None:
+                conn.close()
+            self.slots.release()
+            raise
+
+    async def close(self):
+        while self.idle:
+            self.idle.popleft().close()
+
+
+class HttpxResponse(TransportResponse):
+    def __init__(self, response, deadline: Optional[float]):
+        super().__init__(deadline)
+        self.response = response
+        self.status = response.status_code
+        self.chunks = response.aiter_bytes()  # 按 Content-Encoding 解码，与 aiohttp 行为一致
+
+    def header(self, name: str) -> Optional[str]:
+        return self.response.headers.get(name)
+
+    async def read_chunk(self) -> bytes:
+        import httpx
+        try:
+            return await within_deadline(self.chunks.__anext__(), self.deadline)
+        except StopAsyncIteration:
+            return b""
+        except httpx.HTTPError as e:
+            raise TransportError(f"{type(e).__name__}: {e}")
+
+    async def release(self):
+        await self.response.aclose()
+
+
+class HttpxTransport(Transport):
+    """httpx.AsyncClient 后端，默认启用 HTTP/2（同一连接上多路复用并发请求）"""
+
+    name = "httpx"
+
+    def __init__(self, limit: int, http2: bool = True):
+        super().__init__(limit)
+        require_optional("httpx")
+        import httpx
+        self.httpx = httpx
+        self.client = httpx.AsyncClient(http2=http2, limits=httpx.Limits(max_connections=limit),
+                                        timeout=httpx.Timeout(None))
+
+    async def post(self, url: str, data: bytes, headers: Dict[str, str], timeouts: RequestTimeouts) -> TransportResponse:
+        httpx = self.httpx
+        deadline = time.monotonic() + timeouts.total if timeouts.total else None
+        request = self.client.build_request("POST", url, content=data, headers=headers,
+                                            timeout=httpx.Timeout(None, connect=timeouts.connect or None))
+        try:
+            response = await within_deadline(self.client.send(request, stream=True), deadline)
+        except httpx.ConnectTimeout:
+            raise PhaseTimeout("connect", timeouts.connect)
+        except httpx.HTTPError as e:
+            raise TransportError(f"{type(e).__name__}: {e}")
+        return HttpxResponse(response, deadline)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+TRANSPORTS = {
+    "aiohttp": AiohttpTransport,
+    "raw": RawHttpTransport,
+    "httpx": HttpxTransport,
+}
+
+EVENT_LOOPS = ("asyncio", "uvloop")
+
+
+# 可选依赖: 模块名 -> 安装命令
+OPTIONAL_DEPENDENCIES = {
+    "httpx": "pip install 'httpx[http2]'",
+    "uvloop": "pip install uvloop",
+}
+
+
+def require_optional(name: str):
+    """检查可选依赖（httpx 后端 / uvloop 事件循环）是否已安装，缺失时抛出带安装提示的 RuntimeError"""
+    try:
+        if name == "httpx":
+            import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+            import httpx  # noqa: F401
+        else:
+            __import__(name)
+    except ImportError:
+        raise RuntimeError(f"{name} 未安装，请先安装可选依赖: {OPTIONAL_DEPENDENCIES[name]}")
+
+
+def create_transport(name: str, limit: int) -> Transport:
+    return TRANSPORTS[name](limit)
+
+
+def install_event_loop(name: str):
+    """切换事件循环实现；uvloop 为可选依赖"""
+    if name == "uvloop":
+        require_optional("uvloop")
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    else:
+        asyncio.set_event_loop_policy(None)